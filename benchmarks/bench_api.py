@@ -0,0 +1,198 @@
+"""
+Filename: bench_api.py
+Description: replays a query trace against Books_API and a local stub server
+
+Run from the repository root:
+
+    python -m benchmarks.bench_api [--trace trace.jsonl] [--latency 0.02]
+        [--jitter 0.01] [--error-rate 0.0] [--concurrency 50] [--output results.json]
+
+The stub server from benchmarks.stub_server answers every request, so no
+traffic reaches OpenLibrary. The trace is replayed against the plain sync
+API, the sync API with a response cache and the concurrent AsyncBooks_API,
+and requests/sec and tail latencies are reported for each.
+
+A trace is a JSON lines file with one lookup per line. A line names the
+Books_API ``method`` (is_book_available if missing) and its ``query``; lines
+without a query use their ``title``, so a requests.jsonl style file can be
+replayed as is. Without --trace a skewed trace is generated from the fixtures.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from benchmarks.latency import percentile
+from benchmarks.stub_server import DEFAULT_FIXTURES, StubOpenLibraryServer, load_fixtures
+from library.cache import ResponseCache
+from library.ext_api_interface import AsyncBooks_API, Books_API
+
+VARIANTS = ('sync', 'cached', 'async')
+
+# Books_API methods a trace may call
+TRACE_METHODS = ('is_book_available', 'books_by_author', 'get_book_info', 'search_books',
+    'get_ebooks')
+
+# methods the generated trace rotates through for title queries
+TITLE_METHODS = ('is_book_available', 'get_book_info', 'get_ebooks', 'search_books')
+
+# default number of lookups in a generated trace
+DEFAULT_TRACE_LENGTH = 500
+
+# share of generated lookups for titles that are not in the fixtures
+MISS_RATE = 0.1
+
+def load_trace(path):
+    """Reads a query trace from a JSON lines file.
+
+    :param path: the trace file
+    :returns: a list of (method, query) tuples
+    """
+    trace = []
+    with open(path) as trace_file:
+        for line in trace_file:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            method = entry.get('method', 'is_book_available')
+            if method not in TRACE_METHODS:
+                raise ValueError("Unknown Books_API method in trace: %s" % method)
+            trace.append((method, entry.get('query', entry.get('title'))))
+    return trace
+
+def generate_trace(fixtures, length=DEFAULT_TRACE_LENGTH, seed=0):
+    """Generates a trace where a few popular queries make up most lookups.
+
+    :param fixtures: the responses from load_fixtures
+    :param length: the number of lookups
+    :param seed: the random seed
+    :returns: a list of (method, query) tuples
+    """
+    rng = random.Random(seed)
+    lookups = []
+    for key in sorted(fixtures):
+        name, query = key.split('=', 1)
+        if name == 'author':
+            lookups.append(('books_by_author', query))
+        else:
+            lookups.extend((method, query) for method in TITLE_METHODS)
+    # Zipf-like weights so the head of the list is requested most
+    weights = [1.0 / rank for rank in range(1, len(lookups) + 1)]
+    rng.shuffle(lookups)
+    trace = []
+    for _ in range(length):
+        if rng.random() < MISS_RATE:
+            trace.append(('is_book_available', 'missing title %d' % rng.randrange(1000)))
+        else:
+            trace.append(rng.choices(lookups, weights)[0])
+    return trace
+
+def replay_sync(api, trace):
+    """Replays a trace one lookup at a time.
+
+    :param api: the Books_API
+    :param trace: the (method, query) tuples
+    :returns: the latency of each lookup in seconds
+    """
+    latencies = []
+    for method, query in trace:
+        start = time.perf_counter()
+        getattr(api, method)(query)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def replay_async(async_api, trace):
+    """Replays a trace with all lookups issued concurrently, then closes the API.
+
+    :param async_api: the AsyncBooks_API
+    :param trace: the (method, query) tuples
+    :returns: the latency of each lookup in seconds
+    """
+    async def timed(method, query):
+        start = time.perf_counter()
+        await getattr(async_api, method)(query)
+        return time.perf_counter() - start
+
+    async def replay():
+        async with async_api:
+            return await asyncio.gather(*[timed(method, query) for method, query in trace])
+    return asyncio.run(replay())
+
+def run_variant(variant, server, trace, concurrency):
+    """Replays the trace with one variant of the API.
+
+    :param variant: 'sync', 'cached' or 'async'
+    :param server: the running StubOpenLibraryServer
+    :param trace: the (method, query) tuples
+    :param concurrency: the max concurrent lookups of the async variant
+    :returns: a dictionary with the results of the variant
+    """
+    server.requests = server.errors = 0
+    start = time.perf_counter()
+    if variant == 'async':
+        api = Books_API(pool_size=concurrency)
+        api.API_URL = server.url
+        latencies = replay_async(AsyncBooks_API(api, max_concurrency=concurrency), trace)
+    else:
+        api = Books_API(cache=ResponseCache() if variant == 'cached' else None)
+        api.API_URL = server.url
+        with api:
+            latencies = replay_sync(api, trace)
+    seconds = time.perf_counter() - start
+    latencies = sorted(latencies)
+    return {'variant': variant, 'lookups': len(trace), 'seconds': seconds,
+        'lookups_per_sec': len(trace) / seconds if seconds else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p90_ms': percentile(latencies, 0.90) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+        'server_requests': server.requests, 'server_errors': server.errors}
+
+def main(argv=None):
+    """Runs the replay benchmark and prints the results.
+
+    :param argv: the command line arguments, sys.argv if not given
+    :returns: the results of every variant
+    """
+    parser = argparse.ArgumentParser(description="Replay a query trace against Books_API offline.")
+    parser.add_argument('--trace', help="JSON lines trace, generated from the fixtures if not given")
+    parser.add_argument('--length', type=int, default=DEFAULT_TRACE_LENGTH,
+        help="lookups in a generated trace")
+    parser.add_argument('--fixtures', default=DEFAULT_FIXTURES)
+    parser.add_argument('--latency', type=float, default=0.02, help="mean delay in seconds")
+    parser.add_argument('--jitter', type=float, default=0.01, help="max delay variation in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of 503 responses")
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--variant', action='append', choices=VARIANTS,
+        help="variants to run, all of them if not given")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="JSON file to write the results to")
+    args = parser.parse_args(argv)
+
+    fixtures = load_fixtures(args.fixtures)
+    trace = load_trace(args.trace) if args.trace else generate_trace(fixtures, args.length,
+        args.seed)
+    results = []
+    with StubOpenLibraryServer(fixtures, args.latency, args.jitter, args.error_rate,
+                               seed=args.seed) as server:
+        print("%d lookups against %s (latency %.3fs, jitter %.3fs, error rate %.2f)"
+              % (len(trace), server.url, args.latency, args.jitter, args.error_rate))
+        print("%-8s %10s %10s %10s %10s %10s %10s %8s" % ('variant', 'lookups/s', 'p50 ms',
+            'p90 ms', 'p99 ms', 'max ms', 'requests', 'errors'))
+        for variant in args.variant or VARIANTS:
+            result = run_variant(variant, server, trace, args.concurrency)
+            print("%-8s %10.1f %10.3f %10.3f %10.3f %10.3f %10d %8d" % (variant,
+                result['lookups_per_sec'], result['p50_ms'], result['p90_ms'],
+                result['p99_ms'], result['max_ms'], result['server_requests'],
+                result['server_errors']))
+            results.append(result)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'lookups': len(trace), 'latency': args.latency, 'jitter': args.jitter,
+                'error_rate': args.error_rate, 'results': results}, output, indent=2)
+    return results
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""
+Filename: bench_circulation.py
+Description: measures how Library and Library_DB scale with the number of patrons
+
+Run from the repository root:
+
+    python -m benchmarks.bench_circulation [sizes...] [--engine tinydb|sqlite|log]
+        [--ops N] [--seed N] [--buffered] [--output results.json]
+
+Each size is a number of patrons, 1k, 10k, 100k and 1M by default. For
+every size a synthetic database is loaded in one batch, then register,
+retrieve, borrow, return, count and list-all are timed. Throughput, p50
+and p99 latency and the peak RSS of the run are printed and written to a
+JSON results file, which can be kept to compare commits.
+
+Every size runs in a fresh process, so the peak RSS belongs to that size
+alone. Unbuffered TinyDB rewrites the whole file on each change, so large
+sizes need a smaller --ops or --buffered to finish in reasonable time.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.latency import percentile
+from library import storages
+from library.library import Library
+from library.library_db_interface import open_library_db
+from library.patron import Patron
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+
+# default number of timed operations per workload
+DEFAULT_OPS = 1000
+
+# number of timed get_all_patrons calls per size
+LIST_ALL_REPEATS = 5
+
+# number of distinct titles the synthetic loans are drawn from
+TITLE_COUNT = 5000
+
+# largest number of books a synthetic patron starts with
+MAX_LOANS = 3
+
+DEFAULT_OUTPUT = 'bench_results.json'
+
+FIRST_NAMES = ('Ada', 'Grace', 'Alan', 'Edsger', 'Barbara', 'Donald', 'Frances', 'Ken')
+LAST_NAMES = ('Lovelace', 'Hopper', 'Turing', 'Dijkstra', 'Liskov', 'Knuth', 'Allen', 'Thompson')
+
+def make_member_id(number):
+    """Builds the memberID of a synthetic patron.
+
+    :param number: the patron's number
+    :returns: the memberID
+    """
+    return 'M%07d' % number
+
+def make_title(number):
+    """Builds a synthetic book title.
+
+    :param number: the title's number
+    :returns: the title
+    """
+    return 'Book %d' % number
+
+def make_patrons(size, rng, start=1):
+    """Generates synthetic patrons with a few books borrowed each.
+
+    :param size: the number of patrons
+    :param rng: the random.Random to draw from
+    :param start: the number of the first patron
+    :returns: a generator of Patrons
+    """
+    for number in range(start, start + size):
+        patron = Patron(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), rng.randint(18, 90),
+            make_member_id(number))
+        for _ in range(rng.randint(0, MAX_LOANS)):
+            patron.add_borrowed_book(make_title(rng.randrange(TITLE_COUNT)).lower())
+        yield patron
+
+def summarize(latencies):
+    """Summarizes the latencies of one workload.
+
+    :param latencies: the latency of each operation in seconds
+    :returns: a dictionary with the ops, total seconds, ops per second and
+        the p50 and p99 latency in milliseconds
+    """
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    return {'ops': len(latencies), 'seconds': total,
+        'ops_per_sec': len(latencies) / total if total else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000}
+
+def time_each(operation, arguments):
+    """Times an operation once per set of arguments.
+
+    :param operation: the callable to time
+    :param arguments: an iterable of argument tuples
+    :returns: the list of latencies in seconds
+    """
+    latencies = []
+    for args in arguments:
+        start = time.perf_counter()
+        operation(*args)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def peak_rss_bytes():
+    """Gets the peak resident set size of this process.
+
+    :returns: the peak RSS in bytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def run_size(engine, size, ops, seed, buffered):
+    """Loads a synthetic database and times every workload against it.
+
+    :param engine: the storage engine for open_library_db
+    :param size: the number of patrons to load
+    :param ops: the number of timed operations per workload
+    :param seed: the random seed
+    :param buffered: True to buffer TinyDB writes
+    :returns: a dictionary with the results of the run
+    """
+    rng = random.Random(seed)
+    tmp_dir = tempfile.mkdtemp()
+    options = {'buffered': True} if buffered and engine == 'tinydb' else {}
+    try:
+        db = open_library_db(engine, os.path.join(tmp_dir, 'bench.db'), **options)
+        library = Library(db=db)
+        start = time.perf_counter()
+        db.insert_patrons(make_patrons(size, rng))
+        db.flush()
+        load_seconds = time.perf_counter() - start
+
+        workloads = {}
+        new_patrons = [(patron.get_fname(), patron.get_lname(), patron.get_age(),
+            patron.get_memberID()) for patron in make_patrons(ops, rng, start=size + 1)]
+        workloads['register'] = time_each(library.register_patron, new_patrons)
+
+        member_ids = [make_member_id(rng.randint(1, size)) for _ in range(ops)]
+        workloads['retrieve'] = time_each(db.retrieve_patron, [(id,) for id in member_ids])
+
+        # each loan goes to a distinct patron so the return undoes it
+        patrons = db.retrieve_patrons(dict.fromkeys(member_ids))
+        loans = [(make_title(TITLE_COUNT + i), patron) for i, patron in enumerate(patrons)]
+        workloads['borrow'] = time_each(library.borrow_book, loans)
+        workloads['return'] = time_each(library.return_borrowed_book, loans)
+
+        workloads['count'] = time_each(db.get_patron_count, [()] * ops)
+        workloads['list_all'] = time_each(db.get_all_patrons, [()] * LIST_ALL_REPEATS)
+        db.close_db()
+    finally:
+        shutil.rmtree(tmp_dir)
+    return {'engine': engine, 'buffered': bool(options), 'patrons': size,
+        'load_seconds': load_seconds, 'peak_rss_bytes': peak_rss_bytes(),
+        'workloads': {name: summarize(latencies) for name, latencies in workloads.items()}}
+
+def run_isolated(engine, size, ops, seed, buffered):
+    """Runs one size in a fresh process so its peak RSS is its own.
+
+    :returns: the results from run_size
+    """
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(run_size, (engine, size, ops, seed, buffered))
+
+def git_commit():
+    """Gets the commit being benchmarked.
+
+    :returns: the commit hash, or None outside a git checkout
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_run(run):
+    """Prints the results of one run as a table.
+
+    :param run: the results from run_size
+    """
+    print("%s, %d patrons: loaded in %.3fs, peak RSS %.1f MiB" % (run['engine'],
+        run['patrons'], run['load_seconds'], run['peak_rss_bytes'] / 2 ** 20))
+    print("  %-10s %8s %12s %10s %10s" % ('workload', 'ops', 'ops/s', 'p50 ms', 'p99 ms'))
+    for name, stats in run['workloads'].items():
+        print("  %-10s %8d %12.1f %10.3f %10.3f" % (name, stats['ops'], stats['ops_per_sec'],
+            stats['p50_ms'], stats['p99_ms']))
+
+def main(argv=None):
+    """Runs the benchmark, prints the results and writes the results file.
+
+    :param argv: the command line arguments, sys.argv if not given
+    :returns: the results written to the file
+    """
+    parser = argparse.ArgumentParser(description="Benchmark Library and Library_DB workloads.")
+    parser.add_argument('sizes', nargs='*', type=int, default=list(DEFAULT_SIZES))
+    parser.add_argument('--engine', choices=('tinydb', 'sqlite', 'log'), default='tinydb')
+    parser.add_argument('--ops', type=int, default=DEFAULT_OPS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--buffered', action='store_true', help="buffer TinyDB writes")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    args = parser.parse_args(argv)
+
+    results = {'commit': git_commit(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(), 'platform': platform.platform(),
+        'json_library': storages.JSON_LIBRARY, 'ops': args.ops, 'seed': args.seed, 'runs': []}
+    for size in args.sizes:
+        run = run_isolated(args.engine, size, min(args.ops, size), args.seed, args.buffered)
+        print_run(run)
+        results['runs'].append(run)
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=2)
+    print("Results written to %s" % args.output)
+    return results
+
+if __name__ == '__main__':
+    main()
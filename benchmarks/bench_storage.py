@@ -0,0 +1,78 @@
+"""
+Filename: bench_storage.py
+Description: compares load and flush times of the TinyDB JSON storages
+
+Run from the repository root:
+
+    python -m benchmarks.bench_storage [sizes...]
+
+Each size is a number of patrons, 10k, 100k and 1M by default.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from tinydb.storages import JSONStorage
+
+from library import storages
+from library.storages import FastJSONStorage
+
+DEFAULT_SIZES = (10000, 100000, 1000000)
+
+def make_table(size):
+    """Builds the stored form of a database with the given number of patrons.
+
+    :param size: the number of patrons
+    :returns: the data as TinyDB hands it to a storage
+    """
+    patrons = {}
+    for i in range(1, size + 1):
+        patrons[i] = {'fname': 'first', 'lname': 'last', 'age': 20 + i % 60,
+            'memberID': 'M%07d' % i, 'borrowed_books': ['book %d' % (i % 997)] * (i % 3)}
+    return {'_default': patrons}
+
+def time_storage(storage_cls, path, data):
+    """Times one flush and one load of the data with a storage class.
+
+    :param storage_cls: the TinyDB storage class
+    :param path: the file to use
+    :param data: the database contents
+    :returns: a tuple of flush seconds, load seconds and file bytes
+    """
+    storage = storage_cls(path)
+    start = time.perf_counter()
+    storage.write(data)
+    flush = time.perf_counter() - start
+    storage.close()
+    storage = storage_cls(path)
+    start = time.perf_counter()
+    storage.read()
+    load = time.perf_counter() - start
+    storage.close()
+    return flush, load, os.path.getsize(path)
+
+def main(sizes):
+    """Runs the comparison and prints a table.
+
+    :param sizes: the database sizes to try
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        print("FastJSONStorage uses %s" % storages.JSON_LIBRARY)
+        print("%-10s %-16s %10s %10s %12s" % ('patrons', 'storage', 'flush s', 'load s', 'bytes'))
+        for size in sizes:
+            data = make_table(size)
+            for storage_cls in (JSONStorage, FastJSONStorage):
+                path = os.path.join(tmp_dir, '%s-%d.json' % (storage_cls.__name__, size))
+                flush, load, size_bytes = time_storage(storage_cls, path, data)
+                print("%-10d %-16s %10.3f %10.3f %12d" % (size, storage_cls.__name__, flush,
+                    load, size_bytes))
+                os.remove(path)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,15 @@
+"""
+Filename: latency.py
+Description: helpers shared by the benchmarks for summarizing latencies
+"""
+
+def percentile(latencies, fraction):
+    """Gets a percentile of sorted latencies by the nearest rank.
+
+    :param latencies: the sorted latencies in seconds
+    :param fraction: the percentile as a fraction, like 0.99
+    :returns: the latency at that percentile
+    """
+    if not latencies:
+        return 0.0
+    return latencies[min(len(latencies) - 1, int(round(fraction * (len(latencies) - 1))))]
@@ -0,0 +1,209 @@
+"""
+Filename: stub_server.py
+Description: local stand-in for the OpenLibrary search.json API
+
+Serves recorded search.json responses with configurable latency, jitter
+and error rate, so Books_API can be measured without the real service:
+
+    python -m benchmarks.stub_server [--port 8080] [--latency 0.05]
+        [--jitter 0.02] [--error-rate 0.01] [--fixtures file.json]
+
+Point Books_API at it by setting API_URL to the printed URL. Fixtures map
+"q=<title>" or "author=<name>" keys, lowercased, to search.json response
+bodies. The fields, limit and page parameters are applied to the recorded
+docs the way the real API does, and unknown queries get no results.
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    'fixtures', 'search.json')
+
+# query parameters used to look up a fixture, in order
+SEARCH_PARAMETERS = ('q', 'author', 'title')
+
+def load_fixtures(path=DEFAULT_FIXTURES):
+    """Loads recorded search.json responses.
+
+    :param path: the fixtures file
+    :returns: a dictionary of fixture key to response body
+    """
+    with open(path) as fixtures_file:
+        return {key.lower(): body for key, body in json.load(fixtures_file).items()}
+
+class StubSearchHandler(BaseHTTPRequestHandler):
+    """Answers search.json requests from the server's fixtures."""
+
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, so Nagle would hold the body back
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        """Serves one search request after the configured delay."""
+        server = self.server
+        time.sleep(server.next_delay())
+        url = urlsplit(self.path)
+        if url.path != '/search.json':
+            self._send(404, {'error': 'not found'})
+        elif server.next_is_error():
+            self._send(503, {'error': 'service unavailable'})
+        else:
+            self._send(200, server.search(parse_qs(url.query)))
+
+    def _send(self, status, body):
+        """Sends a JSON response and records it on the server.
+
+        :param status: the HTTP status code
+        :param body: the JSON body
+        """
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.record(status)
+
+    def log_message(self, *args):
+        """Keeps request logging off the benchmark's output."""
+        pass
+
+class StubOpenLibraryServer(ThreadingHTTPServer):
+    """Threaded HTTP server that serves fixtures like the OpenLibrary API."""
+
+    daemon_threads = True
+
+    def __init__(self, fixtures=None, latency=0.0, jitter=0.0, error_rate=0.0,
+                 host='127.0.0.1', port=0, seed=None):
+        """Constructor for the StubOpenLibraryServer class.
+
+        :param fixtures: the responses from load_fixtures, the bundled ones if not given
+        :param latency: the mean delay in seconds before each response
+        :param jitter: the most the delay varies either way, in seconds
+        :param error_rate: the share of requests answered with a 503
+        :param host: the address to listen on
+        :param port: the port to listen on, 0 for any free port
+        :param seed: the random seed for the delays and errors
+        """
+        super().__init__((host, port), StubSearchHandler)
+        self.fixtures = fixtures if fixtures is not None else load_fixtures()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        """The search.json URL of the server."""
+        host, port = self.server_address[:2]
+        return "http://%s:%d/search.json" % (host, port)
+
+    def start(self):
+        """Starts serving on a background thread.
+
+        :returns: the server
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving and closes the socket."""
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        """Enters a with block, starting the server."""
+        return self.start()
+
+    def __exit__(self, *args):
+        """Leaves a with block by stopping the server."""
+        self.stop()
+
+    def next_delay(self):
+        """Draws the delay for the next response.
+
+        :returns: the delay in seconds
+        """
+        with self._lock:
+            offset = self._random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+        return max(0.0, self.latency + offset)
+
+    def next_is_error(self):
+        """Decides whether the next response is an error.
+
+        :returns: True to answer with an error, False if not
+        """
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def record(self, status):
+        """Counts a response that was sent.
+
+        :param status: the HTTP status code
+        """
+        with self._lock:
+            self.requests += 1
+            if status != 200:
+                self.errors += 1
+
+    def search(self, query):
+        """Builds the response to a search from the fixtures.
+
+        :param query: the parsed query string
+        :returns: the search.json body
+        """
+        recorded = {'numFound': 0, 'start': 0, 'docs': []}
+        for name in SEARCH_PARAMETERS:
+            if name in query:
+                key = "%s=%s" % (name, ' '.join(query[name][0].lower().split()))
+                recorded = self.fixtures.get(key, recorded)
+                break
+        docs = recorded['docs']
+        limit = int(query['limit'][0]) if 'limit' in query else len(docs)
+        start = (int(query['page'][0]) - 1) * limit if 'page' in query else 0
+        docs = docs[start:start + limit]
+        if 'fields' in query:
+            fields = query['fields'][0].split(',')
+            docs = [{field: doc[field] for field in fields if field in doc} for doc in docs]
+        return {'numFound': recorded['numFound'], 'start': start, 'docs': docs}
+
+def main(argv=None):
+    """Runs the stub server until interrupted.
+
+    :param argv: the command line arguments, sys.argv if not given
+    """
+    parser = argparse.ArgumentParser(description="Serve recorded OpenLibrary search.json responses.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help="mean delay in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="max delay variation in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of 503 responses")
+    parser.add_argument('--fixtures', default=DEFAULT_FIXTURES)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+    server = StubOpenLibraryServer(load_fixtures(args.fixtures), args.latency, args.jitter,
+        args.error_rate, args.host, args.port, args.seed)
+    print("Serving %d fixtures at %s" % (len(server.fixtures), server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
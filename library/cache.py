@@ -0,0 +1,101 @@
+"""
+Filename: cache.py
+Description: module with the response cache used by the web service interface
+"""
+
+from collections import OrderedDict
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+def normalize_url(url):
+    """Normalizes a request URL so equivalent requests share a cache key.
+
+    The scheme and host are lowercased, whitespace inside query values is
+    collapsed and the query parameters are sorted.
+
+    :param url: the request URL
+    :returns: the normalized URL
+    """
+    parts = urlsplit(url.strip())
+    query = [(key, ' '.join(value.split()))
+             for key, value in parse_qsl(parts.query, keep_blank_values=True)]
+    query.sort()
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path,
+                       urlencode(query), ''))
+
+class ResponseCache:
+    """Bounded TTL and LRU cache for decoded API responses."""
+
+    def __init__(self, max_size=1024, ttl=300, negative_ttl=60):
+        """Constructor for the ResponseCache class.
+
+        :param max_size: the max number of responses kept, least recently used go first
+        :param ttl: seconds a response with results is kept
+        :param negative_ttl: seconds a response without results is kept
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        """Gets the cached response for a URL.
+
+        :param url: the request URL
+        :returns: the cached response, or None if missing or expired
+        """
+        key = normalize_url(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, response = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, url, response):
+        """Caches the response for a URL.
+
+        Responses without any docs are kept for negative_ttl instead of ttl.
+
+        :param url: the request URL
+        :param response: the decoded JSON response
+        """
+        if response is None or self.max_size <= 0:
+            return
+        ttl = self.ttl if response.get('docs') else self.negative_ttl
+        key = normalize_url(url)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Removes every cached response and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def hit_rate(self):
+        """Gets the share of lookups that were served from the cache.
+
+        :returns: the hit rate between 0 and 1
+        """
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+        return self.hits / lookups
+
+    def __len__(self):
+        """Gets the number of cached responses."""
+        return len(self._entries)
@@ -4,26 +4,174 @@ Description: module used for interacting with a web service and other things
 Tester: Marigold
 """
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import copy
+import threading
+from urllib.parse import quote, urlencode
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from library import metrics
+from library.cache import normalize_url
+from library.resilience import SingleFlight
+
+class BooksAPIException(Exception):
+    """Custom Exception for a request the OpenLibrary API did not answer."""
+    pass
 
 class Books_API:
     """Class used for interacting with the OpenLibrary API."""
 
     API_URL = "http://openlibrary.org/search.json"
 
+    # fields requested by each kind of search
+    AVAILABLE_FIELDS = ('key',)
+    AUTHOR_FIELDS = ('title_suggest',)
+    INFO_FIELDS = ('title', 'publisher', 'publish_year', 'language')
+    EBOOK_FIELDS = ('title', 'ebook_count_i')
+    SEARCH_FIELDS = ('title', 'ebook_count_i', 'publisher', 'publish_year', 'language')
+
+    # number of titles fetched per page by iter_books_by_author
+    AUTHOR_PAGE_SIZE = 100
+
+    def __init__(self, pool_size=10, connect_timeout=3.05, read_timeout=10, cache=None,
+                 result_limit=None, breaker=None, coalesce=True):
+        """Constructor for the Books_API class.
+
+        Requests go through one pooled session, so connections to the API are
+        kept alive and reused between calls.
+
+        :param pool_size: the max number of connections kept open per host
+        :param connect_timeout: seconds to wait for a connection
+        :param read_timeout: seconds to wait for the response
+        :param cache: the ResponseCache shared by all requests, None to disable
+        :param result_limit: the max number of results per search, None for the API default
+        :param breaker: the CircuitBreaker guarding the API, None to disable
+        :param coalesce: True to share one fetch between concurrent identical requests
+        """
+        self.cache = cache
+        self.result_limit = result_limit
+        self.breaker = breaker
+        self.flights = SingleFlight() if coalesce else None
+        self._local = threading.local()
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.session.headers.update({'Connection': 'keep-alive'})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        """Closes the session and its pooled connections."""
+        self.session.close()
+
+    def __enter__(self):
+        """Enters a with block, returning the API."""
+        return self
+
+    def __exit__(self, *args):
+        """Leaves a with block by closing the API."""
+        self.close()
+
+    @contextmanager
+    def raising_errors(self):
+        """Makes failed requests raise BooksAPIException instead of returning
+        None, for the calls made by the current thread inside the with block.
+        """
+        previous = getattr(self._local, 'raise_errors', False)
+        self._local.raise_errors = True
+        try:
+            yield self
+        finally:
+            self._local.raise_errors = previous
+
     def make_request(self, url):
         """Makes a HTTP request to the given URL.
+
+        Concurrent requests for the same URL share one fetch. While the
+        circuit breaker is open no request is sent at all. The JSON body is
+        shared with the cache and with coalesced callers, so it must not be
+        modified; the search methods hand out copies.
         
         :param url: the url used for the HTTP request
-        :returns: the JSON body of the request, None if non 200 status code or ConnectionError
+        :returns: the JSON body of the request, None if non 200 status code, ConnectionError,
+            Timeout or the circuit breaker is open
+        :raises BooksAPIException: instead of returning None inside raising_errors
         """
+        if self.cache is not None:
+            json_data = self.cache.get(url)
+            if json_data is not None:
+                metrics.count(metrics.CACHE_HITS)
+                return json_data
+            metrics.count(metrics.CACHE_MISSES)
         try:
-            response = requests.get(url)
-            if response.status_code != 200:
-                return None
-            return response.json()
-        except requests.ConnectionError:
+            if self.flights is None:
+                return self._fetch(url)
+            json_data, shared = self.flights.do(normalize_url(url), lambda: self._fetch(url))
+        except BooksAPIException:
+            if getattr(self._local, 'raise_errors', False):
+                raise
             return None
+        if shared:
+            metrics.count(metrics.COALESCED)
+        return json_data
+
+    def _fetch(self, url):
+        """Sends the HTTP request for make_request through the circuit breaker.
+
+        Connection errors, timeouts and 5xx responses count as failures.
+
+        :param url: the url used for the HTTP request
+        :returns: the JSON body of the request
+        :raises BooksAPIException: if the request failed or was not sent
+        """
+        if self.breaker is not None and not self.breaker.allow_request():
+            metrics.count(metrics.BREAKER_REJECTIONS)
+            raise BooksAPIException("Circuit breaker is open: %s" % url)
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as error:
+            self._record_outcome(False)
+            raise BooksAPIException("Request failed: %s" % url) from error
+        self._record_outcome(response.status_code < 500)
+        if metrics.is_enabled():
+            metrics.count(metrics.BYTES_FETCHED, len(response.content))
+        if response.status_code != 200:
+            raise BooksAPIException("Status %s for %s" % (response.status_code, url))
+        json_data = response.json()
+        if self.cache is not None:
+            self.cache.put(url, json_data)
+        return json_data
+
+    def _record_outcome(self, success):
+        """Reports the outcome of a request to the circuit breaker, if any.
+
+        :param success: True if the API answered, False if it failed
+        """
+        if self.breaker is None:
+            return
+        if success:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def build_url(self, fields, limit=None, **params):
+        """Builds a URL-encoded search URL that only asks for the given fields.
+
+        :param fields: the names of the result fields to return
+        :param limit: the max number of results, capped by result_limit
+        :param params: the search parameters, such as q or author
+        :returns: the request URL
+        """
+        if self.result_limit is not None:
+            limit = self.result_limit if limit is None else min(limit, self.result_limit)
+        params['fields'] = ','.join(fields)
+        if limit is not None:
+            params['limit'] = limit
+        return "%s?%s" % (self.API_URL, urlencode(params, quote_via=quote))
 
     def is_book_available(self, book):
         """Determines if a given book is available to borrow.
@@ -31,7 +179,7 @@ class Books_API:
         :param book: the title of the book
         :returns: True if available, False if not
         """
-        request_url = "%s?q=%s" % (self.API_URL, book)
+        request_url = self.build_url(self.AVAILABLE_FIELDS, limit=1, q=book)
         json_data = self.make_request(request_url)
         if json_data and len(json_data['docs']) >= 1:
             return True
@@ -43,14 +191,36 @@ class Books_API:
         :param author: the name of the author
         :returns: the titles of all the books in a list form
         """
-        request_url = "%s?author=%s" % (self.API_URL, author)
-        json_data = self.make_request(request_url)
-        if not json_data:
-            return []
-        books = []
-        for book in json_data['docs']:
-            books.append(book['title_suggest'])
-        return books
+        return list(self.iter_books_by_author(author))
+
+    def iter_books_by_author(self, author, page_size=None):
+        """Lazily yields the books written by a given author, page by page.
+
+        The next page is only requested once the titles of the previous one
+        have been consumed, so callers can stop early.
+
+        :param author: the name of the author
+        :param page_size: the number of titles per request, AUTHOR_PAGE_SIZE if not given
+        :returns: a generator of book titles
+        """
+        page_size = page_size or self.AUTHOR_PAGE_SIZE
+        if self.result_limit is not None:
+            page_size = min(page_size, self.result_limit)
+        page = 1
+        seen = 0
+        while True:
+            request_url = self.build_url(self.AUTHOR_FIELDS, limit=page_size, page=page,
+                author=author)
+            json_data = self.make_request(request_url)
+            if not json_data:
+                return
+            docs = json_data['docs']
+            for book in docs:
+                yield book['title_suggest']
+            seen += len(docs)
+            if len(docs) < page_size or seen >= json_data.get('numFound', seen + 1):
+                return
+            page += 1
 
     def get_book_info(self, book):
         """Gets the information for a given book.
@@ -58,7 +228,7 @@ class Books_API:
         :param book: the title of the book
         :returns: a list of dictionaries with book data
         """
-        request_url = "%s?q=%s" % (self.API_URL, book)
+        request_url = self.build_url(self.INFO_FIELDS, q=book)
         json_data = self.make_request(request_url)
         if not json_data:
             return []
@@ -72,7 +242,20 @@ class Books_API:
             if 'language' in book:
                 info.update({'language': book['language']})
             books_info.append(info)
-        return books_info
+        # the field values are lists held by the cached response
+        return copy.deepcopy(books_info)
+
+    def search_books(self, book):
+        """Gets the raw search results for a given book.
+
+        :param book: the title of the book
+        :returns: a copy of the list of result documents
+        """
+        request_url = self.build_url(self.SEARCH_FIELDS, q=book)
+        json_data = self.make_request(request_url)
+        if not json_data:
+            return []
+        return copy.deepcopy(json_data['docs'])
 
     def get_ebooks(self, book):
         """Gets the ebooks for a given book.
@@ -80,7 +263,7 @@ class Books_API:
         :param book: the title of the book
         :returns: data about the ebooks
         """
-        request_url = "%s?q=%s" % (self.API_URL, book)
+        request_url = self.build_url(self.EBOOK_FIELDS, q=book)
         json_data = self.make_request(request_url)
         if not json_data:
             return []
@@ -89,3 +272,86 @@ class Books_API:
             if book['ebook_count_i'] >= 1:
                 ebooks.append({'title': book['title'], 'ebook_count': book['ebook_count_i']})
         return ebooks
+
+
+class AsyncBooks_API:
+    """Asyncio interface to the OpenLibrary API for many concurrent lookups.
+
+    Each lookup runs the matching Books_API method on a worker thread, so
+    the event loop is never blocked. All lookups share one Books_API and
+    its connection pool, and the worker pool's ``max_concurrency`` threads
+    bound how many run at a time. Nothing is tied to one event loop, so the
+    same instance can be used from several ``asyncio.run`` calls.
+    """
+
+    def __init__(self, api=None, max_concurrency=50):
+        """Constructor for the AsyncBooks_API class.
+
+        :param api: the Books_API to use, one with a pool of max_concurrency if not given
+        :param max_concurrency: the max number of lookups in flight
+        """
+        self.api = api if api is not None else Books_API(pool_size=max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    async def _run(self, method, *args):
+        """Runs a Books_API method on the worker pool.
+
+        :param method: the bound Books_API method
+        :returns: the result of the method
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, method, *args)
+
+    async def is_book_available(self, book):
+        """Determines if a given book is available to borrow.
+
+        :param book: the title of the book
+        :returns: True if available, False if not
+        """
+        return await self._run(self.api.is_book_available, book)
+
+    async def books_by_author(self, author):
+        """Gets all the books written by a given author.
+
+        :param author: the name of the author
+        :returns: the titles of all the books in a list form
+        """
+        return await self._run(self.api.books_by_author, author)
+
+    async def get_book_info(self, book):
+        """Gets the information for a given book.
+
+        :param book: the title of the book
+        :returns: a list of dictionaries with book data
+        """
+        return await self._run(self.api.get_book_info, book)
+
+    async def search_books(self, book):
+        """Gets the raw search results for a given book.
+
+        :param book: the title of the book
+        :returns: the list of result documents
+        """
+        return await self._run(self.api.search_books, book)
+
+    async def get_ebooks(self, book):
+        """Gets the ebooks for a given book.
+
+        :param book: the title of the book
+        :returns: data about the ebooks
+        """
+        return await self._run(self.api.get_ebooks, book)
+
+    def close(self):
+        """Stops the worker pool and closes the underlying Books_API."""
+        self._executor.shutdown(wait=True)
+        self.api.close()
+
+    async def __aenter__(self):
+        """Enters an async with block, returning the API."""
+        return self
+
+    async def __aexit__(self, *args):
+        """Leaves an async with block by closing the API without blocking
+        the event loop while running lookups finish."""
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
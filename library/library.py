@@ -3,17 +3,52 @@ Filename: library.py
 Description: Library class used for SWEN-352 mocking activity.
 """
 
-from library.patron import Patron
-from library.library_db_interface import Library_DB
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import json
+
+from library.patron import Patron, InvalidNameException
+from library.library_db_interface import open_library_db
 from library.ext_api_interface import Books_API
+from library.cache import ResponseCache
+from library.resilience import CircuitBreaker
+from library.titles import normalize_title
+
+class InvalidCirculationException(Exception):
+    """Custom Exception for a circulation event that can't be applied."""
+    pass
 
 class Library:
     """Class used to represent a library."""
 
-    def __init__(self):
-        """Constructor for the Library class."""
-        self.db = Library_DB()
-        self.api = Books_API()
+    # outcomes reported by register_patrons
+    INSERTED = 'inserted'
+    DUPLICATE = 'duplicate'
+    INVALID = 'invalid'
+
+    # record fields register_patrons needs a value for
+    REQUIRED_FIELDS = ('fname', 'lname', 'memberID')
+
+    # actions accepted by apply_circulation
+    BORROW = 'borrow'
+    RETURN = 'return'
+
+    # default number of worker threads for the batch API methods
+    MAX_WORKERS = 8
+
+    def __init__(self, db=None, api=None):
+        """Constructor for the Library class.
+
+        :param db: the Library_DB to use, the configured database from
+            open_library_db if not given
+        :param api: the Books_API to use, one with a response cache and a
+            circuit breaker if not given
+        """
+        self.db = db if db is not None else open_library_db()
+        if api is None:
+            api = Books_API(cache=ResponseCache(), breaker=CircuitBreaker())
+        self.api = api
 
     ############################################################################
     ################################ API METHODS ###############################
@@ -26,9 +61,9 @@ class Library:
         :returns: True if yes, False if not
         """
         ebooks = self.api.get_ebooks(book)
-        book = book.lower()
+        book = normalize_title(book)
         for ebook in ebooks:
-            if book == ebook['title'].lower():
+            if book == normalize_title(ebook['title']):
                 return True
         return False
 
@@ -51,9 +86,9 @@ class Library:
         :param book: the name of the book
         :returns: True if the book was written by the author, False if not
         """
-        results = self.api.books_by_author(author)
-        for result in results:
-            if book.lower() == result.lower():
+        book = normalize_title(book)
+        for result in self.api.iter_books_by_author(author):
+            if book == normalize_title(result):
                 return True
         return False
 
@@ -70,6 +105,84 @@ class Library:
                 lang_set.update(book['language'])
         return lang_set
 
+    def get_book_profile(self, book):
+        """Gets everything the library shows about a book with one search.
+
+        :param book: the title of the book
+        :returns: a dictionary with is_ebook and ebook_count (as from is_ebook
+            and get_ebooks_count), and the sets of languages, publishers and
+            publish_years found for the book
+        """
+        title = normalize_title(book)
+        profile = {'is_ebook': False, 'ebook_count': 0, 'languages': set(),
+            'publishers': set(), 'publish_years': set()}
+        for doc in self.api.search_books(book):
+            ebook_count = doc.get('ebook_count_i', 0)
+            if ebook_count >= 1:
+                profile['ebook_count'] += ebook_count
+                if not profile['is_ebook'] and normalize_title(doc['title']) == title:
+                    profile['is_ebook'] = True
+            profile['languages'].update(doc.get('language', ()))
+            profile['publishers'].update(doc.get('publisher', ()))
+            profile['publish_years'].update(doc.get('publish_year', ()))
+        return profile
+
+    def get_ebooks_counts(self, books, max_workers=None):
+        """Gets the number of ebooks for each of the given books.
+
+        :param books: the titles of the books
+        :param max_workers: the number of concurrent lookups, MAX_WORKERS if not given
+        :returns: a tuple of a dictionary of title to ebook count, and a
+            dictionary of title to the exception raised for that title,
+            including a BooksAPIException if the API did not answer
+        """
+        return self._map_books(self.get_ebooks_count, books, max_workers)
+
+    def get_languages_for_books(self, books, max_workers=None):
+        """Get the available languages for each of the given books.
+
+        :param books: the titles of the books
+        :param max_workers: the number of concurrent lookups, MAX_WORKERS if not given
+        :returns: a tuple of a dictionary of title to language set, and a
+            dictionary of title to the exception raised for that title,
+            including a BooksAPIException if the API did not answer
+        """
+        return self._map_books(self.get_languages_for_book, books, max_workers)
+
+    def _map_books(self, method, books, max_workers):
+        """Runs a single-title method for every distinct title on a worker pool.
+
+        Failed API requests raise inside the lookups, so they are reported
+        as errors rather than as empty results.
+
+        :param method: the method taking one title
+        :param books: the titles of the books, titles that normalize to the
+            same key are looked up once
+        :param max_workers: the number of concurrent lookups, MAX_WORKERS if not given
+        :returns: a tuple of the results and the errors, both keyed by title
+            as given and in the order the titles were given
+        """
+        books = list(dict.fromkeys(books))
+        results = {}
+        errors = {}
+        if not books:
+            return results, errors
+        def lookup(book):
+            with self.api.raising_errors():
+                return method(book)
+        with ThreadPoolExecutor(max_workers=max_workers or self.MAX_WORKERS) as executor:
+            futures = {}
+            for book in books:
+                key = normalize_title(book)
+                if key not in futures:
+                    futures[key] = executor.submit(lookup, book)
+            for book in books:
+                try:
+                    results[book] = futures[normalize_title(book)].result()
+                except Exception as error:
+                    errors[book] = error
+        return results, errors
+
     ############################################################################
     ################################# DB METHODS ###############################
     ############################################################################
@@ -86,6 +199,96 @@ class Library:
         patron = Patron(fname, lname, age, memberID)
         return self.db.insert_patron(patron)
 
+    def register_patrons(self, records):
+        """Registers many Patrons with the library in one database write.
+
+        Each record is a dictionary with the fname, lname, age and memberID
+        keys. Records that are not dictionaries, have a bad name, miss a
+        field or have no value for fname, lname or memberID are not inserted,
+        and neither are memberIDs that are already registered or repeated
+        within the batch.
+
+        :param records: an iterable of Patron records
+        :returns: a list of outcome dictionaries, one per record, with the
+            memberID, the status (INSERTED, DUPLICATE or INVALID) and the
+            new ID if inserted
+        """
+        outcomes = []
+        patrons = []
+        for record in records:
+            patron = self._convert_record(record)
+            if patron is None:
+                memberID = record.get('memberID') if isinstance(record, Mapping) else None
+                outcomes.append({'memberID': memberID, 'status': self.INVALID, 'id': None})
+                continue
+            outcome = {'memberID': patron.get_memberID(), 'status': None, 'id': None}
+            outcomes.append(outcome)
+            patrons.append((patron, outcome))
+        ids = self.db.insert_patrons([patron for patron, _ in patrons])
+        for (patron, outcome), id in zip(patrons, ids):
+            if id is None:
+                outcome['status'] = self.DUPLICATE
+            else:
+                outcome['status'] = self.INSERTED
+                outcome['id'] = id
+        return outcomes
+
+    def _convert_record(self, record):
+        """Builds the Patron for a record passed to register_patrons.
+
+        :param record: the Patron record
+        :returns: the Patron, or None if the record is invalid
+        """
+        if not isinstance(record, Mapping) or 'age' not in record:
+            return None
+        if any(record.get(field) is None for field in self.REQUIRED_FIELDS):
+            return None
+        try:
+            return Patron(record['fname'], record['lname'], record['age'], record['memberID'])
+        except (InvalidNameException, TypeError):
+            return None
+
+    def register_patrons_from_file(self, stream, file_format='csv'):
+        """Registers the Patrons read from a CSV or JSON lines stream.
+
+        CSV streams need a header row with the fname, lname, age and memberID
+        columns. Numeric ages in a CSV are converted to integers. Short CSV
+        rows and JSON lines that don't parse are reported as INVALID.
+
+        :param stream: an open text file or other iterable of lines
+        :param file_format: 'csv' or 'jsonl'
+        :returns: the outcomes from register_patrons
+        """
+        if file_format == 'csv':
+            records = (self._convert_csv_record(row) for row in csv.DictReader(stream))
+        elif file_format == 'jsonl':
+            records = (self._convert_jsonl_record(line) for line in stream if line.strip())
+        else:
+            raise ValueError("Unknown patron file format: %s" % file_format)
+        return self.register_patrons(records)
+
+    def _convert_csv_record(self, row):
+        """Converts a CSV row to a Patron record.
+
+        :param row: the dictionary read by csv.DictReader
+        :returns: the Patron record
+        """
+        age = row.get('age')
+        if age is not None and age.strip().isdigit():
+            row['age'] = int(age)
+        return row
+
+    def _convert_jsonl_record(self, line):
+        """Converts a JSON line to a Patron record.
+
+        :param line: the line of JSON
+        :returns: the Patron record, or None if the line isn't valid JSON
+        """
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
     def is_patron_registered(self, patron):
         """Determines if the Patron is already registered in the database.
         
@@ -103,8 +306,9 @@ class Library:
         :param book: the title of the book
         :param patron: the Patron object
         """
-        patron.add_borrowed_book(book.lower())
-        self.db.update_patron(patron)
+        book = normalize_title(book)
+        patron.add_borrowed_book(book)
+        self.db.add_borrowed_book(patron.get_memberID(), book)
 
     def return_borrowed_book(self, book, patron):
         """Returns a borrowed book for a Patron.
@@ -112,8 +316,57 @@ class Library:
         :param book: the title of the book
         :param patron: the Patron object
         """
-        patron.return_borrowed_book(book.lower())
-        self.db.update_patron(patron)
+        book = normalize_title(book)
+        patron.return_borrowed_book(book)
+        self.db.remove_borrowed_book(patron.get_memberID(), book)
+
+    def apply_circulation(self, events):
+        """Applies many borrow and return events with one database write.
+
+        The events are grouped per Patron and applied in order to freshly
+        loaded copies of the Patrons, then every affected Patron is written
+        back at once. If any event is invalid nothing is written.
+
+        :param events: an iterable of (memberID, title, action) tuples where
+            action is BORROW or RETURN
+        :returns: a dictionary of memberID to the updated Patron
+        :raises InvalidCirculationException: for an unknown action or Patron
+        """
+        by_member = {}
+        for memberID, book, action in events:
+            if action not in (self.BORROW, self.RETURN):
+                raise InvalidCirculationException("Unknown circulation action: %s" % action)
+            by_member.setdefault(memberID, []).append((normalize_title(book), action))
+        patrons = self.db.retrieve_patrons(by_member)
+        updated = {}
+        for memberID, patron in zip(by_member, patrons):
+            if patron is None:
+                raise InvalidCirculationException("Patron is not registered: %s" % memberID)
+            for book, action in by_member[memberID]:
+                if action == self.BORROW:
+                    patron.add_borrowed_book(book)
+                else:
+                    patron.return_borrowed_book(book)
+            updated[memberID] = patron
+        if updated:
+            self.db.update_patrons(updated.values())
+        return updated
+
+    def who_has(self, book):
+        """Finds the Patrons that currently have a given book checked out.
+
+        :param book: the title of the book
+        :returns: the set of memberIDs holding the book
+        """
+        return self.db.get_holders(normalize_title(book))
+
+    def copies_out(self, book):
+        """Gets the number of copies of a given book that are checked out.
+
+        :param book: the title of the book
+        :returns: the number of Patrons holding the book
+        """
+        return self.db.count_holders(normalize_title(book))
 
     def is_book_borrowed(self, book, patron):
         """Determines if the Patron has borrowed a given book.
@@ -122,6 +375,5 @@ class Library:
         :param patron: the Patron object
         :returns: True if the Patron has borrowed the book, False if not
         """
-        borrowed_books = patron.get_borrowed_books()
-        return book.lower() in borrowed_books
+        return patron.has_borrowed_book(normalize_title(book))
 
@@ -4,18 +4,242 @@ Description: module used for interacting with the local database
 Tester: Yuli!
 """
 
+from library import metrics
 from library.patron import Patron
-from tinydb import TinyDB, Query
+from library.storages import BufferedMiddleware, FastJSONStorage
+from library.titles import normalize_titles
+from tinydb import TinyDB
 import os
 
-class Library_DB:
-    """Class for the local library database."""
+# environment variables that pick the database for open_library_db
+ENGINE_VARIABLE = 'LIBRARY_DB_ENGINE'
+PATH_VARIABLE = 'LIBRARY_DB_PATH'
 
-    DATABASE_FILE = 'db.json'
+class Base_Library_DB:
+    """Interface implemented by every library database engine.
+
+    Engines keep a title to holders index in ``_holders`` through
+    ``_update_holders``, or override ``get_holders`` and ``count_holders``.
+    """
+
+    DATABASE_FILE = None
 
     def __init__(self):
-        """Constructor for the Library_DB object."""
-        self.db = TinyDB(self.DATABASE_FILE)
+        """Constructor for the Base_Library_DB object."""
+        self._holders = {}
+
+    def insert_patron(self, patron):
+        """Inserts a Patron into the database.
+
+        :param patron: the Patron object
+        :returns: the Patron's ID or None
+        """
+        raise NotImplementedError
+
+    def insert_patrons(self, patrons):
+        """Inserts many Patrons into the database.
+
+        :param patrons: an iterable of Patron objects
+        :returns: a list with the new ID, or None if skipped, for each Patron
+        """
+        raise NotImplementedError
+
+    def get_patron_count(self):
+        """Gets the number of Patrons in the database.
+
+        :returns: the total number of Patrons in the DB
+        """
+        raise NotImplementedError
+
+    def get_all_patrons(self):
+        """Gets a list of all the Patrons in the database.
+
+        :returns: a list of all the Patrons in the same dictionary format as TinyDB
+        """
+        raise NotImplementedError
+
+    def iter_patrons(self, chunk_size=None):
+        """Lazily yields every Patron in the database.
+
+        :param chunk_size: yield lists of up to this many Patrons instead of
+            single Patrons, None to yield them one by one
+        :returns: a generator of Patrons, or of lists of Patrons
+        """
+        raise NotImplementedError
+
+    def update_patron(self, patron):
+        """Updates a Patron's data in the DB.
+
+        :param patron: the new Patron object to be updated
+        :returns: None if the patron parameter is not the correct object
+        """
+        raise NotImplementedError
+
+    def update_patrons(self, patrons):
+        """Updates many Patrons' data in the DB.
+
+        :param patrons: the new Patron objects to be updated
+        :returns: the memberIDs that were found and updated
+        """
+        raise NotImplementedError
+
+    def add_borrowed_book(self, memberID, book):
+        """Adds a book to a Patron's borrowed books, leaving other fields alone.
+
+        :param memberID: the ID of the Patron
+        :param book: the title of the book, already normalized
+        :returns: True if the Patron was found, False if not
+        """
+        raise NotImplementedError
+
+    def remove_borrowed_book(self, memberID, book):
+        """Removes a book from a Patron's borrowed books, leaving other fields alone.
+
+        :param memberID: the ID of the Patron
+        :param book: the title of the book, already normalized
+        :returns: True if the Patron was found, False if not
+        """
+        raise NotImplementedError
+
+    def retrieve_patron(self, memberID):
+        """Gets a Patron from the database.
+
+        :param memberID: the ID for the Patron to retrieve
+        :returns: the Patron with the given ID and their borrowed books, or None
+        """
+        raise NotImplementedError
+
+    def retrieve_patrons(self, member_ids):
+        """Gets many Patrons from the database.
+
+        :param member_ids: the IDs of the Patrons to retrieve
+        :returns: a list with the Patron, or None if not found, for each ID
+        """
+        return [self.retrieve_patron(memberID) for memberID in member_ids]
+
+    def flush(self):
+        """Writes any pending changes to storage, if the engine holds any."""
+        pass
+
+    def close_db(self):
+        """Closes the database."""
+        raise NotImplementedError
+
+    def _update_holders(self, memberID, old_books, new_books):
+        """Moves a Patron in the title to holders index from one set of
+        borrowed books to another.
+
+        :param memberID: the ID of the Patron
+        :param old_books: the titles the Patron had
+        :param new_books: the titles the Patron has now
+        """
+        for book in old_books:
+            if book in new_books:
+                continue
+            holders = self._holders.get(book)
+            if holders is not None:
+                holders.discard(memberID)
+                if not holders:
+                    del self._holders[book]
+        for book in new_books:
+            self._holders.setdefault(book, set()).add(memberID)
+
+    def get_holders(self, book):
+        """Gets the Patrons that currently have a given book.
+
+        :param book: the title of the book, already normalized
+        :returns: the set of memberIDs holding the book
+        """
+        return set(self._holders.get(book, ()))
+
+    def count_holders(self, book):
+        """Gets the number of Patrons that currently have a given book.
+
+        :param book: the title of the book, already normalized
+        :returns: the number of copies checked out
+        """
+        return len(self._holders.get(book, ()))
+
+    def __enter__(self):
+        """Enters a with block, returning the database."""
+        return self
+
+    def __exit__(self, *args):
+        """Leaves a with block by flushing and closing the database."""
+        self.close_db()
+
+    def convert_patron_to_db_format(self, patron):
+        """Converts the Patron object to a dictionary format.
+        
+        :param patron: the Patron python object
+        :returns: a dictionary of the Patron's data
+        """
+        return {'fname': patron.get_fname(), 'lname': patron.get_lname(), 'age': patron.get_age(), 'memberID': patron.get_memberID(),
+        'borrowed_books': patron.get_borrowed_books()}
+
+class Library_DB(Base_Library_DB):
+    """Class for the local library database, stored in a TinyDB JSON file."""
+
+    DATABASE_FILE = 'db.json'
+
+    def __init__(self, path=None, buffered=False, flush_every=1000, flush_interval=None):
+        """Constructor for the Library_DB object.
+
+        In buffered mode writes are kept in memory and only written to the
+        file every ``flush_every`` writes, on the first write after
+        ``flush_interval`` seconds, on ``flush()``, on ``close_db()`` or when
+        leaving a ``with`` block. There is no background flush, so after a
+        quiet period the last writes stay buffered until one of those happens.
+        Writes that have not been flushed are lost if the process dies.
+
+        :param path: the database file, DATABASE_FILE if not given
+        :param buffered: True to batch writes in memory
+        :param flush_every: the number of buffered writes that trigger a flush
+        :param flush_interval: the seconds after a flush from which the next
+            write flushes, None to disable
+        """
+        if path is None:
+            path = self.DATABASE_FILE
+        super(Library_DB, self).__init__()
+        self._buffer = None
+        if buffered:
+            self._buffer = BufferedMiddleware(FastJSONStorage, flush_every=flush_every,
+                flush_interval=flush_interval)
+            self.db = TinyDB(path, storage=self._buffer)
+        else:
+            self.db = TinyDB(path, storage=FastJSONStorage)
+        self._index = {}
+        self._build_index()
+
+    def _build_index(self):
+        """Builds the memberID to document ID index and the title to holders
+        index from the stored Patrons.
+
+        Borrowed books stored under an older title rule are only normalized
+        in memory here, opening the database never writes to it. A stored
+        document is normalized the next time that Patron is written.
+        """
+        self._index = {}
+        self._holders = {}
+        scanned = 0
+        for doc in self.db:
+            scanned += 1
+            # keep the first document for a memberID, like the old search did
+            if doc['memberID'] in self._index:
+                continue
+            self._index[doc['memberID']] = doc.doc_id
+            self._update_holders(doc['memberID'], (),
+                normalize_titles(doc.get('borrowed_books', [])))
+        metrics.count(metrics.DOCS_SCANNED, scanned)
+
+    def _count_table_read(self):
+        """Reports a TinyDB call that loads the whole table.
+
+        TinyDB 3 reads and rebuilds every document on each insert, update
+        and get, even by document ID, so these count as a scan of all the
+        Patrons in the index.
+        """
+        metrics.count(metrics.DOCS_SCANNED, len(self._index))
 
     def insert_patron(self, patron):
         """Inserts a Patron into the database.
@@ -25,19 +249,50 @@ class Library_DB:
         """
         if not patron:
             return None
-        if self.retrieve_patron(patron.get_memberID()): # patron already in db
+        if patron.get_memberID() in self._index: # patron already in db
             return None
         data = self.convert_patron_to_db_format(patron)
+        self._count_table_read()
         id = self.db.insert(data)
+        self._index[patron.get_memberID()] = id
+        self._update_holders(patron.get_memberID(), (), data['borrowed_books'])
         return id
 
+    def insert_patrons(self, patrons):
+        """Inserts many Patrons into the database with a single write.
+
+        Patrons whose memberID is already in the database, or appears earlier
+        in the same batch, are skipped.
+
+        :param patrons: an iterable of Patron objects
+        :returns: a list with the new ID, or None if skipped, for each Patron
+        """
+        positions = []
+        new_data = []
+        batch_ids = {}
+        for patron in patrons:
+            memberID = patron.get_memberID() if patron else None
+            if not patron or memberID in self._index or memberID in batch_ids:
+                positions.append(None)
+                continue
+            batch_ids[memberID] = len(new_data)
+            positions.append(len(new_data))
+            new_data.append(self.convert_patron_to_db_format(patron))
+        if not new_data:
+            return positions
+        self._count_table_read()
+        doc_ids = self.db.insert_multiple(new_data)
+        for memberID, position in batch_ids.items():
+            self._index[memberID] = doc_ids[position]
+            self._update_holders(memberID, (), new_data[position]['borrowed_books'])
+        return [doc_ids[i] if i is not None else None for i in positions]
+
     def get_patron_count(self):
         """Gets the number of Patrons in the database.
         
         :returns: the total number of Patrons in the DB
         """
-        results = self.db.all()
-        return len(results)
+        return len(self._index)
 
     def get_all_patrons(self):
         """Gets a list of all the Patrons in the database.
@@ -45,8 +300,35 @@ class Library_DB:
         :returns: a list of all the Patrons
         """
         results = self.db.all()
+        metrics.count(metrics.DOCS_SCANNED, len(results))
         return results
 
+    def iter_patrons(self, chunk_size=None):
+        """Lazily yields every Patron in the database.
+
+        :param chunk_size: yield lists of up to this many Patrons instead of
+            single Patrons, None to yield them one by one
+        :returns: a generator of Patrons, or of lists of Patrons
+        """
+        scanned = 0
+        try:
+            if not chunk_size:
+                for doc in self.db:
+                    scanned += 1
+                    yield Patron.from_record(doc)
+                return
+            chunk = []
+            for doc in self.db:
+                scanned += 1
+                chunk.append(Patron.from_record(doc))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+        finally:
+            metrics.count(metrics.DOCS_SCANNED, scanned)
+
     def update_patron(self, patron):
         """Updates a Patron's data in the DB.
         
@@ -55,33 +337,159 @@ class Library_DB:
         """
         if not patron:
             return None
-        query = Query()
+        doc_id = self._index.get(patron.get_memberID())
+        if doc_id is None:
+            return None
         data = self.convert_patron_to_db_format(patron)
-        self.db.update(data, query.memberID == patron.get_memberID())
+        self._count_table_read()
+        self.db.update(lambda doc: self._replace_document(doc, data), doc_ids=[doc_id])
+
+    def update_patrons(self, patrons):
+        """Updates many Patrons' data in the DB with a single write.
+
+        :param patrons: the new Patron objects to be updated
+        :returns: the memberIDs that were found and updated
+        """
+        by_member = {}
+        doc_ids = []
+        for patron in patrons:
+            doc_id = self._index.get(patron.get_memberID())
+            if doc_id is None:
+                continue
+            by_member[patron.get_memberID()] = self.convert_patron_to_db_format(patron)
+            doc_ids.append(doc_id)
+        if not doc_ids:
+            return []
+        # TinyDB only passes the document to the function, so match on memberID
+        self._count_table_read()
+        self.db.update(lambda doc: self._replace_document(doc, by_member[doc['memberID']]),
+            doc_ids=doc_ids)
+        return list(by_member)
+
+    def _replace_document(self, doc, data):
+        """Overwrites a stored document, keeping the holders index in sync.
+
+        :param doc: the stored document
+        :param data: the new data from convert_patron_to_db_format
+        """
+        self._update_holders(data['memberID'], normalize_titles(doc.get('borrowed_books', ())),
+            data['borrowed_books'])
+        doc.update(data)
+
+    def add_borrowed_book(self, memberID, book):
+        """Adds a book to a Patron's borrowed books, leaving other fields alone.
+
+        :param memberID: the ID of the Patron
+        :param book: the title of the book, already normalized
+        :returns: True if the Patron was found, False if not
+        """
+        def add(doc):
+            borrowed_books = self._normalize_document(doc)
+            if book not in borrowed_books:
+                borrowed_books.append(book)
+            self._holders.setdefault(book, set()).add(memberID)
+        return self._update_borrowed_books(memberID, add)
+
+    def remove_borrowed_book(self, memberID, book):
+        """Removes a book from a Patron's borrowed books, leaving other fields alone.
+
+        :param memberID: the ID of the Patron
+        :param book: the title of the book, already normalized
+        :returns: True if the Patron was found, False if not
+        """
+        def remove(doc):
+            borrowed_books = self._normalize_document(doc)
+            if book in borrowed_books:
+                borrowed_books.remove(book)
+                self._update_holders(memberID, (book,), ())
+        return self._update_borrowed_books(memberID, remove)
+
+    def _normalize_document(self, doc):
+        """Normalizes the borrowed books of a stored document being written.
+
+        :param doc: the stored document
+        :returns: the document's list of borrowed books
+        """
+        doc['borrowed_books'] = normalize_titles(doc.get('borrowed_books', []))
+        return doc['borrowed_books']
+
+    def _update_borrowed_books(self, memberID, change):
+        """Applies a change to the stored document of one Patron.
+
+        :param memberID: the ID of the Patron
+        :param change: a function that edits the document in place
+        :returns: True if the Patron was found, False if not
+        """
+        doc_id = self._index.get(memberID)
+        if doc_id is None:
+            return False
+        self._count_table_read()
+        self.db.update(change, doc_ids=[doc_id])
+        return True
 
     def retrieve_patron(self, memberID):
         """Gets a Patron from the database.
         
         :param memberID: the ID for the Patron to retrieve
-        :returns: the Patron with the given ID, or None
-        """
-        query = Query()
-        # assuming no two people in the db have the same memberID
-        results = self.db.search(query.memberID == memberID)
-        if results:
-            return Patron(results[0]['fname'], results[0]['lname'], results[0]['age'],
-            results[0]['memberID'])
+        :returns: the Patron with the given ID and their borrowed books, or None
+        """
+        doc_id = self._index.get(memberID)
+        if doc_id is None:
+            return None
+        self._count_table_read()
+        result = self.db.get(doc_id=doc_id)
+        if result:
+            return Patron.from_record(result)
         return None
 
+    def retrieve_patrons(self, member_ids):
+        """Gets many Patrons from the database in one pass over the table.
+
+        :param member_ids: the IDs of the Patrons to retrieve
+        :returns: a list with the Patron, or None if not found, for each ID
+        """
+        member_ids = list(member_ids)
+        wanted = {}
+        for memberID in member_ids:
+            doc_id = self._index.get(memberID)
+            if doc_id is not None:
+                wanted[doc_id] = None
+        if wanted:
+            scanned = 0
+            for doc in self.db:
+                scanned += 1
+                if doc.doc_id in wanted:
+                    wanted[doc.doc_id] = Patron.from_record(doc)
+            metrics.count(metrics.DOCS_SCANNED, scanned)
+        return [wanted.get(self._index.get(memberID)) for memberID in member_ids]
+
+    def flush(self):
+        """Writes any buffered changes to the database file."""
+        if self._buffer is not None:
+            self._buffer.flush()
+
     def close_db(self):
-        """Closes the database."""
+        """Closes the database, flushing any buffered changes first."""
         self.db.close()
 
-    def convert_patron_to_db_format(self, patron):
-        """Converts the Patron object to a dictionary format.
-        
-        :param patron: the Patron python object
-        :returns: a dictionary of the Patron's data
-        """
-        return {'fname': patron.get_fname(), 'lname': patron.get_lname(), 'age': patron.get_age(), 'memberID': patron.get_memberID(),
-        'borrowed_books': patron.get_borrowed_books()}
+def open_library_db(engine=None, path=None, **options):
+    """Opens the library database with the configured storage engine.
+
+    :param engine: 'tinydb', 'sqlite' or 'log', from LIBRARY_DB_ENGINE if not given,
+        defaulting to 'tinydb'
+    :param path: the database file, from LIBRARY_DB_PATH if not given,
+        defaulting to the engine's DATABASE_FILE
+    :param options: extra keyword arguments for the engine's constructor
+    :returns: the Base_Library_DB for that engine
+    """
+    engine = engine or os.environ.get(ENGINE_VARIABLE) or 'tinydb'
+    path = path or os.environ.get(PATH_VARIABLE) or None
+    if engine == 'tinydb':
+        return Library_DB(path, **options)
+    if engine == 'sqlite':
+        from library.sqlite_db_interface import SQLite_Library_DB
+        return SQLite_Library_DB(path, **options)
+    if engine == 'log':
+        from library.log_db_interface import Log_Library_DB
+        return Log_Library_DB(path, **options)
+    raise ValueError("Unknown database engine: %s" % engine)
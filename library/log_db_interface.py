@@ -0,0 +1,304 @@
+"""
+Filename: log_db_interface.py
+Description: module used for keeping the local database in an append-only log
+"""
+
+import mmap
+import os
+import tempfile
+
+from library.library_db_interface import Base_Library_DB
+from library.patron import Patron
+from library.storages import dumps_json, loads_json
+from library.titles import normalize_title, normalize_titles
+
+class Log_Library_DB(Base_Library_DB):
+    """Library database kept as an append-only log of changes.
+
+    Every change is appended to the log as one JSON line (an insert, a full
+    update, or a single borrow or return), so writing costs as much as the
+    change rather than the whole database. Opening the database replays the
+    log into memory, which serves all reads. ``compact`` rewrites the log as
+    a snapshot with one insert per Patron.
+
+    Each write is a single line: changes to several Patrons are appended as
+    one batch record, so they are replayed together or not at all. Appends
+    go to the operating system straight away; pass ``sync=True`` to also
+    fsync each one. A torn last line left by a crash is dropped when the
+    log is opened again, and a write that fails partway is cut back off
+    before the next one.
+    """
+
+    DATABASE_FILE = 'db.log'
+
+    # record types in the log
+    INSERT = 'insert'
+    UPDATE = 'update'
+    BORROW = 'borrow'
+    RETURN = 'return'
+    BATCH = 'batch'
+
+    def __init__(self, path=None, sync=False):
+        """Constructor for the Log_Library_DB object.
+
+        :param path: the log file, DATABASE_FILE if not given
+        :param sync: True to fsync the log after every change
+        """
+        if path is None:
+            path = self.DATABASE_FILE
+        super(Log_Library_DB, self).__init__()
+        self.path = path
+        self.sync = sync
+        self._records = {}
+        self._ids = {}
+        self._last_id = 0
+        self._replay()
+        self._open_log()
+
+    def _open_log(self):
+        """Opens the log for appending and remembers where it ends."""
+        self._log = open(self.path, 'ab', buffering=0)
+        self._end = self._log.seek(0, os.SEEK_END)
+
+    def _replay(self):
+        """Rebuilds the in-memory state by scanning the log file."""
+        if not os.path.exists(self.path) or not os.path.getsize(self.path):
+            return
+        with open(self.path, 'r+b') as log_file:
+            with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+                valid_end = 0
+                start = 0
+                size = len(log_map)
+                while start < size:
+                    end = log_map.find(b'\n', start)
+                    if end == -1:
+                        break # torn write at the end of the log
+                    self._apply(loads_json(log_map[start:end]))
+                    start = valid_end = end + 1
+            if valid_end < size:
+                log_file.truncate(valid_end)
+
+    def _apply(self, entry):
+        """Applies one log entry to the in-memory state.
+
+        Titles are normalized again, since older entries may have been
+        written under an older title rule.
+
+        :param entry: the decoded log entry
+        """
+        op = entry['op']
+        if op == self.BATCH:
+            for batch_entry in entry['entries']:
+                self._apply(batch_entry)
+        elif op == self.INSERT:
+            record = entry['doc']
+            record['borrowed_books'] = normalize_titles(record['borrowed_books'])
+            memberID = record['memberID']
+            self._records[memberID] = record
+            self._ids[memberID] = entry['id']
+            self._last_id = max(self._last_id, entry['id'])
+            self._update_holders(memberID, (), record['borrowed_books'])
+        elif op == self.UPDATE:
+            record = entry['doc']
+            record['borrowed_books'] = normalize_titles(record['borrowed_books'])
+            memberID = record['memberID']
+            self._update_holders(memberID, self._records[memberID]['borrowed_books'],
+                record['borrowed_books'])
+            self._records[memberID] = record
+        else:
+            memberID = entry['memberID']
+            book = normalize_title(entry['book'])
+            borrowed_books = self._records[memberID]['borrowed_books']
+            if op == self.BORROW and book not in borrowed_books:
+                borrowed_books.append(book)
+                self._update_holders(memberID, (), (book,))
+            elif op == self.RETURN and book in borrowed_books:
+                borrowed_books.remove(book)
+                self._update_holders(memberID, (book,), ())
+
+    def _append(self, entries):
+        """Writes log entries to the end of the log as one line and applies them.
+
+        If the write fails the log is truncated back to where it ended, so a
+        partial line never has another one appended after it.
+
+        :param entries: the entries to append
+        """
+        if not entries:
+            return
+        entry = entries[0] if len(entries) == 1 else {'op': self.BATCH, 'entries': entries}
+        line = dumps_json(entry) + b'\n'
+        try:
+            remaining = memoryview(line)
+            while remaining:
+                remaining = remaining[self._log.write(remaining):]
+            if self.sync:
+                os.fsync(self._log.fileno())
+        except BaseException:
+            os.ftruncate(self._log.fileno(), self._end)
+            raise
+        self._end += len(line)
+        for entry in entries:
+            self._apply(entry)
+
+    def insert_patron(self, patron):
+        """Inserts a Patron into the database.
+
+        :param patron: the Patron object
+        :returns: the Patron's ID or None
+        """
+        return self.insert_patrons([patron])[0]
+
+    def insert_patrons(self, patrons):
+        """Inserts many Patrons into the database with a single append.
+
+        Patrons whose memberID is already in the database, or appears earlier
+        in the same batch, are skipped.
+
+        :param patrons: an iterable of Patron objects
+        :returns: a list with the new ID, or None if skipped, for each Patron
+        """
+        ids = []
+        entries = []
+        batch_ids = set()
+        next_id = self._last_id
+        for patron in patrons:
+            memberID = patron.get_memberID() if patron else None
+            if not patron or memberID in self._records or memberID in batch_ids:
+                ids.append(None)
+                continue
+            next_id += 1
+            batch_ids.add(memberID)
+            ids.append(next_id)
+            entries.append({'op': self.INSERT, 'id': next_id,
+                'doc': self.convert_patron_to_db_format(patron)})
+        self._append(entries)
+        return ids
+
+    def get_patron_count(self):
+        """Gets the number of Patrons in the database.
+
+        :returns: the total number of Patrons in the DB
+        """
+        return len(self._records)
+
+    def get_all_patrons(self):
+        """Gets a list of all the Patrons in the database.
+
+        :returns: a list of all the Patrons in the same dictionary format as TinyDB
+        """
+        return [dict(record, borrowed_books=list(record['borrowed_books']))
+                for record in self._records.values()]
+
+    def iter_patrons(self, chunk_size=None):
+        """Lazily yields every Patron in the database.
+
+        :param chunk_size: yield lists of up to this many Patrons instead of
+            single Patrons, None to yield them one by one
+        :returns: a generator of Patrons, or of lists of Patrons
+        """
+        records = list(self._records.values())
+        if not chunk_size:
+            for record in records:
+                yield Patron.from_record(record)
+            return
+        for start in range(0, len(records), chunk_size):
+            yield [Patron.from_record(record) for record in records[start:start + chunk_size]]
+
+    def update_patron(self, patron):
+        """Updates a Patron's data in the DB.
+
+        :param patron: the new Patron object to be updated
+        :returns: None if the patron parameter is not the correct object
+        """
+        if not patron:
+            return None
+        self.update_patrons([patron])
+
+    def update_patrons(self, patrons):
+        """Updates many Patrons' data in the DB with a single append.
+
+        :param patrons: the new Patron objects to be updated
+        :returns: the memberIDs that were found and updated
+        """
+        entries = [{'op': self.UPDATE, 'doc': self.convert_patron_to_db_format(patron)}
+                   for patron in patrons if patron.get_memberID() in self._records]
+        self._append(entries)
+        return [entry['doc']['memberID'] for entry in entries]
+
+    def add_borrowed_book(self, memberID, book):
+        """Appends a borrow of one book by a Patron.
+
+        :param memberID: the ID of the Patron
+        :param book: the title of the book, already normalized
+        :returns: True if the Patron was found, False if not
+        """
+        return self._append_loan(self.BORROW, memberID, book)
+
+    def remove_borrowed_book(self, memberID, book):
+        """Appends a return of one book by a Patron.
+
+        :param memberID: the ID of the Patron
+        :param book: the title of the book, already normalized
+        :returns: True if the Patron was found, False if not
+        """
+        return self._append_loan(self.RETURN, memberID, book)
+
+    def _append_loan(self, op, memberID, book):
+        """Appends a borrow or return if it changes the Patron's books.
+
+        :param op: BORROW or RETURN
+        :param memberID: the ID of the Patron
+        :param book: the title of the book
+        :returns: True if the Patron was found, False if not
+        """
+        record = self._records.get(memberID)
+        if record is None:
+            return False
+        if (book in record['borrowed_books']) != (op == self.BORROW):
+            self._append([{'op': op, 'memberID': memberID, 'book': book}])
+        return True
+
+    def retrieve_patron(self, memberID):
+        """Gets a Patron from the database.
+
+        :param memberID: the ID for the Patron to retrieve
+        :returns: the Patron with the given ID and their borrowed books, or None
+        """
+        record = self._records.get(memberID)
+        if record is None:
+            return None
+        return Patron.from_record(record)
+
+    def compact(self):
+        """Rewrites the log as a snapshot holding one insert per Patron.
+
+        The snapshot is written to a temporary file and renamed over the log,
+        so the old log stays intact if compaction is interrupted.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.log')
+        try:
+            with os.fdopen(fd, 'wb') as snapshot:
+                for memberID, record in self._records.items():
+                    entry = {'op': self.INSERT, 'id': self._ids[memberID], 'doc': record}
+                    snapshot.write(dumps_json(entry) + b'\n')
+                snapshot.flush()
+                os.fsync(snapshot.fileno())
+            self._log.close()
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            if self._log.closed:
+                self._open_log()
+
+    def flush(self):
+        """Forces the log to disk."""
+        os.fsync(self._log.fileno())
+
+    def close_db(self):
+        """Closes the database."""
+        self._log.close()
@@ -0,0 +1,234 @@
+"""
+Filename: metrics.py
+Description: module with opt-in instrumentation for the library classes
+
+Calling ``enable(sink)`` wraps every public method of Library, Books_API
+and the database engines (Base_Library_DB and its subclasses) so each call
+is timed and reported to the sink, along with the counters the classes
+report themselves (bytes fetched, response cache hits and misses, coalesced
+requests, requests rejected by the circuit breaker, database documents
+scanned).
+``disable()`` puts the original methods back, so nothing is timed or
+counted while instrumentation is off.
+"""
+
+import functools
+import inspect
+import logging
+import threading
+import time
+
+# upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, float('inf'))
+
+# names of the counters reported by the instrumented classes
+BYTES_FETCHED = 'books_api.bytes_fetched'
+CACHE_HITS = 'books_api.cache_hits'
+CACHE_MISSES = 'books_api.cache_misses'
+COALESCED = 'books_api.coalesced'
+BREAKER_REJECTIONS = 'books_api.breaker_rejections'
+# documents Library_DB loads from TinyDB: full iterations, plus every insert,
+# update and get, since TinyDB 3 rebuilds the whole table for each of those
+DOCS_SCANNED = 'library_db.docs_scanned'
+
+_sink = None
+_originals = {}
+
+class InMemorySink:
+    """Sink that aggregates calls and counters in memory."""
+
+    def __init__(self):
+        """Constructor for the InMemorySink class."""
+        self.calls = {}
+        self.histograms = {}
+        self.latency_sums = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method, seconds):
+        """Records one call of a method.
+
+        :param method: the qualified method name, like Library.borrow_book
+        :param seconds: how long the call took
+        """
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            self.latency_sums[method] = self.latency_sums.get(method, 0.0) + seconds
+            buckets = self.histograms.get(method)
+            if buckets is None:
+                buckets = self.histograms[method] = [0] * len(LATENCY_BUCKETS)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+                    break
+
+    def count(self, name, amount):
+        """Adds to a counter.
+
+        :param name: the counter name
+        :param amount: the amount to add
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def cache_hit_rate(self):
+        """Gets the share of Books_API requests served from the response cache.
+
+        :returns: the hit rate between 0 and 1
+        """
+        hits = self.counters.get(CACHE_HITS, 0)
+        lookups = hits + self.counters.get(CACHE_MISSES, 0)
+        if not lookups:
+            return 0.0
+        return hits / lookups
+
+    def prometheus_text(self):
+        """Dumps everything recorded in the Prometheus text format.
+
+        :returns: the metrics as text
+        """
+        with self._lock:
+            lines = ['# TYPE library_calls_total counter']
+            for method in sorted(self.calls):
+                lines.append('library_calls_total{method="%s"} %d' % (method, self.calls[method]))
+            lines.append('# TYPE library_call_seconds histogram')
+            for method in sorted(self.histograms):
+                cumulative = 0
+                for bound, hits in zip(LATENCY_BUCKETS, self.histograms[method]):
+                    cumulative += hits
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('library_call_seconds_bucket{method="%s",le="%s"} %d'
+                                 % (method, le, cumulative))
+                lines.append('library_call_seconds_sum{method="%s"} %f'
+                             % (method, self.latency_sums[method]))
+                lines.append('library_call_seconds_count{method="%s"} %d'
+                             % (method, self.calls[method]))
+            lines.append('# TYPE library_events_total counter')
+            for name in sorted(self.counters):
+                lines.append('library_events_total{name="%s"} %d' % (name, self.counters[name]))
+        lines.append('# TYPE library_cache_hit_ratio gauge')
+        lines.append('library_cache_hit_ratio %f' % self.cache_hit_rate())
+        return '\n'.join(lines) + '\n'
+
+class LoggingSink:
+    """Sink that logs every call and counter update."""
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        """Constructor for the LoggingSink class.
+
+        :param logger: the logger to use, the library.metrics logger if not given
+        :param level: the level to log at
+        """
+        self.logger = logger or logging.getLogger(__name__)
+        self.level = level
+
+    def observe(self, method, seconds):
+        """Logs one call of a method.
+
+        :param method: the qualified method name
+        :param seconds: how long the call took
+        """
+        self.logger.log(self.level, "%s took %.6fs", method, seconds)
+
+    def count(self, name, amount):
+        """Logs a counter update.
+
+        :param name: the counter name
+        :param amount: the amount added
+        """
+        self.logger.log(self.level, "%s += %d", name, amount)
+
+def count(name, amount=1):
+    """Adds to a counter if instrumentation is enabled.
+
+    :param name: the counter name
+    :param amount: the amount to add
+    """
+    if _sink is not None:
+        _sink.count(name, amount)
+
+def is_enabled():
+    """Determines if instrumentation is currently enabled.
+
+    :returns: True if enabled, False if not
+    """
+    return _sink is not None
+
+def enable(sink=None):
+    """Turns on instrumentation for Library, Books_API and the database engines.
+
+    :param sink: where to report, a new InMemorySink if not given
+    :returns: the sink
+    """
+    global _sink
+    disable()
+    _sink = sink if sink is not None else InMemorySink()
+    for cls in _instrumented_classes():
+        for name, method in list(vars(cls).items()):
+            if name.startswith('_') or not inspect.isfunction(method):
+                continue
+            _originals[(cls, name)] = method
+            setattr(cls, name, _timed(method, "%s.%s" % (cls.__name__, name)))
+    return _sink
+
+def disable():
+    """Turns off instrumentation and restores the original methods."""
+    global _sink
+    for (cls, name), method in _originals.items():
+        setattr(cls, name, method)
+    _originals.clear()
+    _sink = None
+
+def _instrumented_classes():
+    """Gets the classes to instrument, including every loaded database engine.
+
+    :returns: a list of classes
+    """
+    from library.library import Library
+    from library.library_db_interface import Base_Library_DB
+    from library.ext_api_interface import Books_API
+    classes = [Library, Books_API]
+    engines = [Base_Library_DB]
+    while engines:
+        cls = engines.pop()
+        classes.append(cls)
+        engines.extend(cls.__subclasses__())
+    return classes
+
+def _timed(method, qualified_name):
+    """Wraps a method so its calls are reported to the sink.
+
+    Generator methods are timed until they are exhausted or closed.
+
+    :param method: the function to wrap
+    :param qualified_name: the name to report it under
+    :returns: the wrapper
+    """
+    if inspect.isgeneratorfunction(method):
+        @functools.wraps(method)
+        def generator_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                yield from method(*args, **kwargs)
+            finally:
+                _observe(qualified_name, time.perf_counter() - start)
+        return generator_wrapper
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _observe(qualified_name, time.perf_counter() - start)
+    return wrapper
+
+def _observe(qualified_name, seconds):
+    """Reports one call to the sink if instrumentation is still enabled.
+
+    :param qualified_name: the method name
+    :param seconds: how long the call took
+    """
+    sink = _sink
+    if sink is not None:
+        sink.observe(qualified_name, seconds)
@@ -5,6 +5,11 @@ Description: Patron class for SWEN-352 mocking activity.
 
 import re
 
+from library.titles import normalize_title
+
+# names are rejected if they contain any digit
+DIGIT_PATTERN = re.compile(r'\d')
+
 class InvalidNameException(Exception):
     """Custom Exception for an invalid name."""
     pass
@@ -12,6 +17,10 @@ class InvalidNameException(Exception):
 class Patron:
     """Patron class used to represent a user for a library."""
 
+    # no per-instance __dict__, borrowed books are an insertion-ordered dict
+    # used as a set so lookups and removals don't scan
+    __slots__ = ('fname', 'lname', 'age', 'memberID', '_borrowed_books')
+
     def  __init__(self, fname, lname, age, memberID):
         """Constructor for the Patron class.
 
@@ -21,47 +30,87 @@ class Patron:
         :param memberID: the ID for the Patron in the library's system
         """
 
-        if re.search('\d', fname) or re.search('\d', lname):
+        if DIGIT_PATTERN.search(fname) or DIGIT_PATTERN.search(lname):
             raise InvalidNameException("Name should not contain numbers")
         self.fname = fname
         self.lname = lname
         self.age = age
         self.memberID = memberID
-        self.borrowed_books = []
+        self._borrowed_books = {}
+
+    @classmethod
+    def from_record(cls, record):
+        """Builds a Patron from a stored record without validating it again.
+
+        Only use this for data that already went through the constructor,
+        such as rows loaded from the database. Borrowed books are normalized
+        again in case they were stored under an older title rule.
+
+        :param record: a dictionary with the fname, lname, age and memberID keys,
+            and optionally borrowed_books
+        :returns: the Patron
+        """
+        patron = cls.__new__(cls)
+        patron.fname = record['fname']
+        patron.lname = record['lname']
+        patron.age = record['age']
+        patron.memberID = record['memberID']
+        patron._borrowed_books = dict.fromkeys(map(normalize_title,
+            record.get('borrowed_books', ())))
+        return patron
+
+    @property
+    def borrowed_books(self):
+        """The list of borrowed books for the Patron."""
+        return list(self._borrowed_books)
 
     def add_borrowed_book(self, book):
         """Adds a book to the list of borrowed books for the Patron
         
         :param book: the title of the book
         """
-        book = book.lower()
-        if book in self.borrowed_books:
+        book = normalize_title(book)
+        if book in self._borrowed_books:
             return
-        self.borrowed_books.append(book)
+        self._borrowed_books[book] = None
+
+    def has_borrowed_book(self, book):
+        """Determines if the Patron currently has the given book.
+
+        :param book: the title of the book, already normalized
+        :returns: True if the book is borrowed, False if not
+        """
+        return book in self._borrowed_books
 
     def get_borrowed_books(self):
         """Gets the list of borrowed books for the Patron.
         
         :returns: the list of borrowed books
         """
-        return self.borrowed_books
+        return list(self._borrowed_books)
 
     def return_borrowed_book(self, book):
         """Removes the borrowed book from the list of books currently checked out.
         
         :param book: the title of the book to remove
         """
-        book = book.lower()
-        if book in self.borrowed_books:
-            self.borrowed_books.remove(book)
+        book = normalize_title(book)
+        self._borrowed_books.pop(book, None)
 
     def  __eq__(self, other):
         """Equals function for the Patron class."""
-        return self.__dict__ == other.__dict__
+        if not isinstance(other, Patron):
+            return NotImplemented
+        return (self.fname == other.fname and self.lname == other.lname and
+                self.age == other.age and self.memberID == other.memberID and
+                list(self._borrowed_books) == list(other._borrowed_books))
 
     def __ne__(self, other):
         """Not-equal function for the Patron class."""
-        return not self.__eq__(other)
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
 
     def get_fname(self):
         """Getter for the first name of the Patron.
@@ -0,0 +1,133 @@
+"""
+Filename: resilience.py
+Description: module with the circuit breaker and request coalescing used by the web service interface
+"""
+
+from concurrent.futures import Future
+import threading
+import time
+
+class CircuitBreaker:
+    """Circuit breaker that stops calls to a failing service for a while.
+
+    The breaker starts closed. After ``failure_threshold`` failures in a row
+    it opens and rejects every call. Once ``reset_timeout`` seconds have
+    passed it is half-open and lets a single probe through: a success
+    closes it again, a failure opens it for another ``reset_timeout``.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        """Constructor for the CircuitBreaker class.
+
+        :param failure_threshold: the failures in a row that open the breaker
+        :param reset_timeout: seconds the breaker stays open before probing
+        :param clock: the function giving the current time in seconds
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """The current state, CLOSED, OPEN or HALF_OPEN."""
+        with self._lock:
+            if self._state == self.OPEN and self._can_probe():
+                return self.HALF_OPEN
+            return self._state
+
+    def allow_request(self):
+        """Determines if a call may go through, starting a probe if half-open.
+
+        :returns: True if the call may be made, False to fail fast
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and not self._can_probe():
+                return False
+            # half-open: one probe at a time, and a probe that never reported
+            # back is replaced after reset_timeout
+            now = self.clock()
+            if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+                return False
+            self._state = self.HALF_OPEN
+            self._probe_started = now
+            return True
+
+    def record_success(self):
+        """Reports a successful call, closing the breaker."""
+        with self._lock:
+            self.failures = 0
+            self._state = self.CLOSED
+            self._probe_started = None
+
+    def record_failure(self):
+        """Reports a failed call, opening the breaker if there were too many."""
+        with self._lock:
+            self.failures += 1
+            if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = self.clock()
+                self._probe_started = None
+
+    def _can_probe(self):
+        """Determines if an open breaker has waited long enough to probe.
+
+        :returns: True if reset_timeout has passed since it opened
+        """
+        return self.clock() - self._opened_at >= self.reset_timeout
+
+class SingleFlight:
+    """Shares one call between concurrent callers asking for the same key."""
+
+    def __init__(self):
+        """Constructor for the SingleFlight class."""
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        """Calls a function, unless a call for the key is already in flight.
+
+        Callers that arrive while the call runs wait for it and get the same
+        result, or the same exception.
+
+        :param key: the key identifying identical calls
+        :param function: the function to call with no arguments
+        :returns: a tuple of the result and True if it was shared, False if
+            this caller made the call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        if not leader:
+            return call.result(), True
+        try:
+            result = function()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def __len__(self):
+        """Gets the number of calls in flight.
+
+        :returns: the number of keys being fetched
+        """
+        with self._lock:
+            return len(self._calls)
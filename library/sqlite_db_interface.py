@@ -0,0 +1,336 @@
+"""
+Filename: sqlite_db_interface.py
+Description: module used for keeping the local database in SQLite
+"""
+
+import json
+import sqlite3
+
+from tinydb import TinyDB
+
+from library.library_db_interface import Base_Library_DB, Library_DB
+from library.patron import Patron
+from library.storages import loads_json
+from library.titles import normalize_titles
+
+class SQLite_Library_DB(Base_Library_DB):
+    """Library database stored in SQLite instead of a TinyDB JSON file.
+
+    Patrons live in an indexed ``patrons`` table and every borrowed book is
+    also a row of ``loans``, keyed by title, for the holders lookups. All the
+    statements are fixed parameterized SQL, so sqlite3 compiles each one
+    once and reuses it from its statement cache.
+    """
+
+    DATABASE_FILE = 'db.sqlite3'
+
+    # largest number of memberIDs bound in one IN (...) lookup
+    LOOKUP_BATCH = 500
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS patrons ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " memberID UNIQUE NOT NULL,"
+        " fname TEXT NOT NULL,"
+        " lname TEXT NOT NULL,"
+        " age,"
+        " borrowed_books TEXT NOT NULL DEFAULT '[]')",
+        "CREATE TABLE IF NOT EXISTS loans ("
+        " title TEXT NOT NULL,"
+        " memberID NOT NULL,"
+        " PRIMARY KEY (title, memberID)) WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS loans_memberID ON loans (memberID)",
+    )
+
+    INSERT_PATRON = ("INSERT OR IGNORE INTO patrons (memberID, fname, lname, age, borrowed_books)"
+                     " VALUES (?, ?, ?, ?, ?)")
+    UPDATE_PATRON = ("UPDATE patrons SET fname = ?, lname = ?, age = ?, borrowed_books = ?"
+                     " WHERE memberID = ?")
+    UPDATE_BORROWED = "UPDATE patrons SET borrowed_books = ? WHERE memberID = ?"
+    SELECT_PATRON = ("SELECT fname, lname, age, memberID, borrowed_books FROM patrons"
+                     " WHERE memberID = ?")
+    SELECT_BORROWED = "SELECT borrowed_books FROM patrons WHERE memberID = ?"
+    SELECT_ALL = "SELECT fname, lname, age, memberID, borrowed_books FROM patrons ORDER BY id"
+    COUNT_PATRONS = "SELECT COUNT(*) FROM patrons"
+    INSERT_LOAN = "INSERT OR IGNORE INTO loans (title, memberID) VALUES (?, ?)"
+    DELETE_LOAN = "DELETE FROM loans WHERE title = ? AND memberID = ?"
+    DELETE_LOANS = "DELETE FROM loans WHERE memberID = ?"
+    SELECT_HOLDERS = "SELECT memberID FROM loans WHERE title = ?"
+    COUNT_HOLDERS = "SELECT COUNT(*) FROM loans WHERE title = ?"
+    SELECT_ALL_BORROWED = "SELECT memberID, borrowed_books FROM patrons"
+
+    # PRAGMA user_version once borrowed books are stored normalized
+    SCHEMA_VERSION = 1
+
+    def __init__(self, path=None):
+        """Constructor for the SQLite_Library_DB object.
+
+        :param path: the SQLite database file, DATABASE_FILE if not given
+        """
+        if path is None:
+            path = self.DATABASE_FILE
+        super(SQLite_Library_DB, self).__init__()
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            for statement in self.SCHEMA:
+                self.conn.execute(statement)
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+                self._normalize_borrowed_books()
+                self.conn.execute("PRAGMA user_version = %d" % self.SCHEMA_VERSION)
+
+    def _normalize_borrowed_books(self):
+        """Rewrites borrowed books stored under an older title rule, and
+        their loans, inside the current transaction."""
+        for memberID, stored in self.conn.execute(self.SELECT_ALL_BORROWED).fetchall():
+            borrowed_books = json.loads(stored)
+            normalized = normalize_titles(borrowed_books)
+            if normalized == borrowed_books:
+                continue
+            self.conn.execute(self.UPDATE_BORROWED, (json.dumps(normalized), memberID))
+            self.conn.execute(self.DELETE_LOANS, (memberID,))
+            self.conn.executemany(self.INSERT_LOAN, [(book, memberID) for book in normalized])
+
+    def insert_patron(self, patron):
+        """Inserts a Patron into the database.
+
+        :param patron: the Patron object
+        :returns: the Patron's ID or None
+        """
+        if not patron:
+            return None
+        with self.conn:
+            return self._insert(patron)
+
+    def insert_patrons(self, patrons):
+        """Inserts many Patrons into the database in one transaction.
+
+        Patrons whose memberID is already in the database, or appears earlier
+        in the same batch, are skipped.
+
+        :param patrons: an iterable of Patron objects
+        :returns: a list with the new ID, or None if skipped, for each Patron
+        """
+        with self.conn:
+            return [self._insert(patron) if patron else None for patron in patrons]
+
+    def _insert(self, patron):
+        """Inserts a Patron and their loans inside the current transaction.
+
+        :param patron: the Patron object
+        :returns: the Patron's ID, or None if the memberID is taken
+        """
+        data = self.convert_patron_to_db_format(patron)
+        cursor = self.conn.execute(self.INSERT_PATRON, (data['memberID'], data['fname'],
+            data['lname'], data['age'], json.dumps(data['borrowed_books'])))
+        if not cursor.rowcount:
+            return None
+        self.conn.executemany(self.INSERT_LOAN,
+            [(book, data['memberID']) for book in data['borrowed_books']])
+        return cursor.lastrowid
+
+    def get_patron_count(self):
+        """Gets the number of Patrons in the database.
+
+        :returns: the total number of Patrons in the DB
+        """
+        return self.conn.execute(self.COUNT_PATRONS).fetchone()[0]
+
+    def get_all_patrons(self):
+        """Gets a list of all the Patrons in the database.
+
+        :returns: a list of all the Patrons in the same dictionary format as TinyDB
+        """
+        return [self._convert_row_to_record(row) for row in self.conn.execute(self.SELECT_ALL)]
+
+    def iter_patrons(self, chunk_size=None):
+        """Lazily yields every Patron in the database.
+
+        :param chunk_size: yield lists of up to this many Patrons instead of
+            single Patrons, None to yield them one by one
+        :returns: a generator of Patrons, or of lists of Patrons
+        """
+        cursor = self.conn.execute(self.SELECT_ALL)
+        if not chunk_size:
+            for row in cursor:
+                yield self._convert_row_to_patron(row)
+            return
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield [self._convert_row_to_patron(row) for row in rows]
+
+    def update_patron(self, patron):
+        """Updates a Patron's data in the DB.
+
+        :param patron: the new Patron object to be updated
+        :returns: None if the patron parameter is not the correct object
+        """
+        if not patron:
+            return None
+        with self.conn:
+            self._update(patron)
+
+    def update_patrons(self, patrons):
+        """Updates many Patrons' data in the DB in one transaction.
+
+        :param patrons: the new Patron objects to be updated
+        :returns: the memberIDs that were found and updated
+        """
+        with self.conn:
+            return [patron.get_memberID() for patron in patrons if self._update(patron)]
+
+    def _update(self, patron):
+        """Updates a Patron and their loans inside the current transaction.
+
+        :param patron: the new Patron object
+        :returns: True if the Patron was found, False if not
+        """
+        data = self.convert_patron_to_db_format(patron)
+        cursor = self.conn.execute(self.UPDATE_PATRON, (data['fname'], data['lname'],
+            data['age'], json.dumps(data['borrowed_books']), data['memberID']))
+        if not cursor.rowcount:
+            return False
+        self.conn.execute(self.DELETE_LOANS, (data['memberID'],))
+        self.conn.executemany(self.INSERT_LOAN,
+            [(book, data['memberID']) for book in data['borrowed_books']])
+        return True
+
+    def add_borrowed_book(self, memberID, book):
+        """Adds a book to a Patron's borrowed books, leaving other fields alone.
+
+        :param memberID: the ID of the Patron
+        :param book: the title of the book, already normalized
+        :returns: True if the Patron was found, False if not
+        """
+        with self.conn:
+            borrowed_books = self._select_borrowed_books(memberID)
+            if borrowed_books is None:
+                return False
+            if book not in borrowed_books:
+                borrowed_books.append(book)
+                self.conn.execute(self.UPDATE_BORROWED, (json.dumps(borrowed_books), memberID))
+                self.conn.execute(self.INSERT_LOAN, (book, memberID))
+            return True
+
+    def remove_borrowed_book(self, memberID, book):
+        """Removes a book from a Patron's borrowed books, leaving other fields alone.
+
+        :param memberID: the ID of the Patron
+        :param book: the title of the book, already normalized
+        :returns: True if the Patron was found, False if not
+        """
+        with self.conn:
+            borrowed_books = self._select_borrowed_books(memberID)
+            if borrowed_books is None:
+                return False
+            if book in borrowed_books:
+                borrowed_books.remove(book)
+                self.conn.execute(self.UPDATE_BORROWED, (json.dumps(borrowed_books), memberID))
+                self.conn.execute(self.DELETE_LOAN, (book, memberID))
+            return True
+
+    def _select_borrowed_books(self, memberID):
+        """Gets the stored borrowed books of one Patron.
+
+        :param memberID: the ID of the Patron
+        :returns: the list of borrowed books, or None if the Patron is unknown
+        """
+        row = self.conn.execute(self.SELECT_BORROWED, (memberID,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def get_holders(self, book):
+        """Gets the Patrons that currently have a given book.
+
+        :param book: the title of the book, already normalized
+        :returns: the set of memberIDs holding the book
+        """
+        return {row[0] for row in self.conn.execute(self.SELECT_HOLDERS, (book,))}
+
+    def count_holders(self, book):
+        """Gets the number of Patrons that currently have a given book.
+
+        :param book: the title of the book, already normalized
+        :returns: the number of copies checked out
+        """
+        return self.conn.execute(self.COUNT_HOLDERS, (book,)).fetchone()[0]
+
+    def retrieve_patron(self, memberID):
+        """Gets a Patron from the database.
+
+        :param memberID: the ID for the Patron to retrieve
+        :returns: the Patron with the given ID and their borrowed books, or None
+        """
+        row = self.conn.execute(self.SELECT_PATRON, (memberID,)).fetchone()
+        if row is None:
+            return None
+        return self._convert_row_to_patron(row)
+
+    def retrieve_patrons(self, member_ids):
+        """Gets many Patrons from the database through the memberID index.
+
+        :param member_ids: the IDs of the Patrons to retrieve
+        :returns: a list with the Patron, or None if not found, for each ID
+        """
+        member_ids = list(member_ids)
+        unique_ids = list(dict.fromkeys(member_ids))
+        found = {}
+        for start in range(0, len(unique_ids), self.LOOKUP_BATCH):
+            batch = unique_ids[start:start + self.LOOKUP_BATCH]
+            query = ("SELECT fname, lname, age, memberID, borrowed_books FROM patrons"
+                     " WHERE memberID IN (%s)" % ', '.join('?' * len(batch)))
+            for row in self.conn.execute(query, batch):
+                found[row[3]] = self._convert_row_to_patron(row)
+        return [found.get(memberID) for memberID in member_ids]
+
+    def flush(self):
+        """Commits any open transaction."""
+        self.conn.commit()
+
+    def close_db(self):
+        """Closes the database."""
+        self.conn.commit()
+        self.conn.close()
+
+    def _convert_row_to_record(self, row):
+        """Converts a patrons row to the TinyDB dictionary format.
+
+        :param row: the (fname, lname, age, memberID, borrowed_books) row
+        :returns: a dictionary of the Patron's data
+        """
+        return {'fname': row[0], 'lname': row[1], 'age': row[2], 'memberID': row[3],
+            'borrowed_books': json.loads(row[4])}
+
+    def _convert_row_to_patron(self, row):
+        """Converts a patrons row to a Patron.
+
+        :param row: the (fname, lname, age, memberID, borrowed_books) row
+        :returns: the Patron
+        """
+        return Patron.from_record(self._convert_row_to_record(row))
+
+def migrate_json_to_sqlite(json_path=Library_DB.DATABASE_FILE,
+                           sqlite_path=SQLite_Library_DB.DATABASE_FILE):
+    """Copies every Patron from a TinyDB JSON file into an SQLite database.
+
+    Patrons already in the SQLite database are left as they are, so running
+    the migration again is harmless. The JSON file is read directly rather
+    than opened as a Library_DB, so it is never created or written.
+
+    :param json_path: the TinyDB file to read
+    :param sqlite_path: the SQLite file to write
+    :returns: the number of Patrons copied
+    :raises FileNotFoundError: if there is no file at json_path
+    """
+    with open(json_path, 'rb') as json_file:
+        contents = json_file.read()
+    docs = loads_json(contents).get(TinyDB.DEFAULT_TABLE, {}) if contents else {}
+    # in document ID order, so the first document for a memberID wins like in Library_DB
+    patrons = (Patron.from_record(docs[doc_id]) for doc_id in sorted(docs, key=int))
+    with SQLite_Library_DB(sqlite_path) as target:
+        ids = target.insert_patrons(patrons)
+    return sum(1 for id in ids if id is not None)
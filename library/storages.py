@@ -0,0 +1,131 @@
+"""
+Filename: storages.py
+Description: TinyDB storages and middlewares used by the local database
+"""
+
+import json
+import os
+import tempfile
+import time
+
+from tinydb.middlewares import CachingMiddleware
+from tinydb.storages import Storage, touch
+
+# use the fastest JSON library that is installed, dumps_json returns bytes
+try:
+    import orjson
+
+    def dumps_json(data):
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+    loads_json = orjson.loads
+    JSON_LIBRARY = 'orjson'
+except ImportError:
+    try:
+        import ujson
+
+        def dumps_json(data):
+            return ujson.dumps(data, ensure_ascii=False).encode('utf-8')
+
+        loads_json = ujson.loads
+        JSON_LIBRARY = 'ujson'
+    except ImportError:
+        def dumps_json(data):
+            return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+        loads_json = json.loads
+        JSON_LIBRARY = 'json'
+
+class FastJSONStorage(Storage):
+    """JSON file storage using orjson or ujson when installed.
+
+    The file is written compactly to a temporary file next to it, synced,
+    and renamed over the old one, so a crash mid-write leaves the previous
+    version in place instead of a truncated file.
+    """
+
+    def __init__(self, path, create_dirs=False, **kwargs):
+        """Constructor for the FastJSONStorage.
+
+        :param path: the JSON file
+        :param create_dirs: True to create missing parent directories
+        """
+        super(FastJSONStorage, self).__init__()
+        touch(path, create_dirs=create_dirs)
+        self.path = path
+
+    def read(self):
+        """Reads the whole database from the file.
+
+        :returns: the stored data, or None if the file is empty
+        """
+        with open(self.path, 'rb') as db_file:
+            contents = db_file.read()
+        if not contents:
+            return None
+        return loads_json(contents)
+
+    def write(self, data):
+        """Atomically replaces the file with the given data.
+
+        :param data: the current state of the database
+        """
+        serialized = dumps_json(data)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                # keep the permissions of the file being replaced
+                os.fchmod(tmp_file.fileno(), os.stat(self.path).st_mode & 0o777)
+                tmp_file.write(serialized)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+class BufferedMiddleware(CachingMiddleware):
+    """Middleware that keeps writes in memory and flushes them in batches.
+
+    Reads are always served from the in-memory copy. The underlying storage
+    is only written when ``flush_every`` writes have been buffered, when the
+    first write after ``flush_interval`` seconds comes in, or when
+    ``flush``/``close`` is called.
+
+    Durability: anything written since the last flush only exists in this
+    process. A crash or kill before the next flush loses those writes, and
+    other processes reading the file will not see them until then.
+    """
+
+    def __init__(self, storage_cls=FastJSONStorage, flush_every=1000, flush_interval=None):
+        """Constructor for the BufferedMiddleware.
+
+        :param storage_cls: the storage class that is written on flush
+        :param flush_every: the number of buffered writes that trigger a flush
+        :param flush_interval: the seconds after a flush from which the next
+            write flushes, None to disable
+        """
+        super(BufferedMiddleware, self).__init__(storage_cls)
+        self.WRITE_CACHE_SIZE = flush_every
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+
+    def write(self, data):
+        """Buffers the database state, flushing it if a limit was reached.
+
+        :param data: the current state of the database
+        """
+        self.cache = data
+        self._cache_modified_count += 1
+
+        if self._cache_modified_count >= self.WRITE_CACHE_SIZE:
+            self.flush()
+        elif self.flush_interval is not None and \
+                time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Writes all buffered data to the underlying storage."""
+        super(BufferedMiddleware, self).flush()
+        self._last_flush = time.monotonic()
@@ -0,0 +1,34 @@
+"""
+Filename: titles.py
+Description: module used for comparing book titles
+"""
+
+from functools import lru_cache
+import sys
+import unicodedata
+
+# number of distinct titles kept by the normalization cache
+TITLE_CACHE_SIZE = 8192
+
+@lru_cache(maxsize=TITLE_CACHE_SIZE)
+def normalize_title(title):
+    """Normalizes a book title into the key used to compare titles.
+
+    The title is NFKC normalized, case folded and has its whitespace
+    collapsed. Results are interned and cached, so repeated titles are
+    only normalized once and share one string.
+
+    :param title: the title of the book
+    :returns: the normalized title
+    """
+    key = ' '.join(unicodedata.normalize('NFKC', title).casefold().split())
+    return sys.intern(key)
+
+def normalize_titles(titles):
+    """Normalizes a list of stored titles, such as borrowed books saved
+    before titles were normalized this way.
+
+    :param titles: the titles
+    :returns: the list of normalized titles in order, without duplicates
+    """
+    return list(dict.fromkeys(normalize_title(title) for title in titles))
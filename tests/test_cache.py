@@ -0,0 +1,58 @@
+import unittest
+from unittest.mock import patch
+
+from library.cache import ResponseCache, normalize_url
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ResponseCache(max_size=2, ttl=10, negative_ttl=1)
+        self.found = {"docs": [{"title": "Test Book"}]}
+
+    def test_normalize_url(self):
+        self.assertEqual(normalize_url("HTTP://OpenLibrary.org/search.json?q=Test  Book &fields=title"),
+                         normalize_url("http://openlibrary.org/search.json?fields=title&q=Test Book"))
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get("http://openlibrary.org/search.json?q=test"))
+        self.cache.put("http://openlibrary.org/search.json?q=test", self.found)
+        self.assertEqual(self.cache.get("http://openlibrary.org/search.json?q=test"), self.found)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(self.cache.hit_rate(), 0.5)
+
+    @patch('library.cache.time.monotonic')
+    def test_ttl_and_negative_ttl(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        self.cache.put("http://a?q=found", self.found)
+        self.cache.put("http://a?q=missing", {"docs": []})
+        mock_monotonic.return_value = 5
+        self.assertIsNone(self.cache.get("http://a?q=missing"))
+        self.assertEqual(self.cache.get("http://a?q=found"), self.found)
+        mock_monotonic.return_value = 11
+        self.assertIsNone(self.cache.get("http://a?q=found"))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_lru_eviction(self):
+        self.cache.put("http://a?q=1", self.found)
+        self.cache.put("http://a?q=2", self.found)
+        self.cache.get("http://a?q=1")
+        self.cache.put("http://a?q=3", self.found)
+        self.assertIsNotNone(self.cache.get("http://a?q=1"))
+        self.assertIsNone(self.cache.get("http://a?q=2"))
+        self.assertIsNotNone(self.cache.get("http://a?q=3"))
+
+    def test_errors_not_cached(self):
+        self.cache.put("http://a?q=1", None)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_clear(self):
+        self.cache.put("http://a?q=1", self.found)
+        self.cache.get("http://a?q=1")
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.hit_rate(), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,15 @@
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
 import unittest
 from unittest.mock import MagicMock, patch
+from urllib.parse import parse_qs, urlsplit
 
 import requests;
-from library.ext_api_interface import Books_API
+from library.cache import ResponseCache
+from library.ext_api_interface import AsyncBooks_API, Books_API, BooksAPIException
 
 
 class TestBooks_API(unittest.TestCase):
@@ -12,7 +19,7 @@ class TestBooks_API(unittest.TestCase):
         self.api = Books_API()
 
 
-    @patch("requests.get")
+    @patch.object(requests.Session, "get")
     def test_make_request_success(self,mock_get):
         #mock successful response
         mock_response = MagicMock()
@@ -23,9 +30,9 @@ class TestBooks_API(unittest.TestCase):
         url = "http://openlibrary.org/search.json?q=test"
         result = self.api.make_request(url)
         self.assertEqual(result, {"docs": [{"title":"Test Book"}]})
-        mock_get.assert_called_once_with(url)
+        mock_get.assert_called_once_with(url, timeout=self.api.timeout)
 
-    @patch("requests.get")
+    @patch.object(requests.Session, "get")
     def test_make_request_failure_status(self, mock_get):
         #mock a non200 response
         mock_response = MagicMock()
@@ -35,7 +42,7 @@ class TestBooks_API(unittest.TestCase):
         result = self.api.make_request("http://badurl")
         self.assertIsNone(result)
 
-    @patch("requests.get")
+    @patch.object(requests.Session, "get")
     def test_make_request_connection_error(self, mock_get):
         #simulate connection error
         # mock_get.side_effect = Exception("ConnectionError")
@@ -50,6 +57,105 @@ class TestBooks_API(unittest.TestCase):
         # Success! assert none
         self.assertEqual(result, None)
 
+    @patch.object(requests.Session, "get")
+    def test_make_request_timeout(self, mock_get):
+        mock_get.side_effect = requests.exceptions.ReadTimeout("Mocked Timeout")
+        result = self.api.make_request("http://slowurl")
+        self.assertIsNone(result)
+
+    @patch.object(requests.Session, "get")
+    def test_make_request_raising_errors(self, mock_get):
+        mock_get.side_effect = requests.exceptions.ReadTimeout("Mocked Timeout")
+        with self.api.raising_errors():
+            with self.assertRaises(BooksAPIException):
+                self.api.make_request("http://slowurl")
+        mock_response = MagicMock()
+        mock_response.status_code = 503
+        mock_get.side_effect = None
+        mock_get.return_value = mock_response
+        with self.api.raising_errors():
+            self.assertRaises(BooksAPIException, self.api.get_ebooks, "Dune")
+        self.assertEqual(self.api.get_ebooks("Dune"), [])
+
+    def test_session_pool_and_timeouts(self):
+        api = Books_API(pool_size=4, connect_timeout=1, read_timeout=2)
+        self.assertEqual(api.timeout, (1, 2))
+        adapter = api.session.get_adapter("http://openlibrary.org")
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertEqual(api.session.headers['Connection'], 'keep-alive')
+        api.close()
+
+    @patch.object(requests.Session, "close")
+    def test_context_manager_closes_session(self, mock_close):
+        with Books_API() as api:
+            self.assertIsInstance(api, Books_API)
+        mock_close.assert_called_once()
+
+    @patch.object(requests.Session, "get")
+    def test_make_request_cached(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"docs":[{"title":"Test Book"}]}
+        mock_get.return_value = mock_response
+        api = Books_API(cache=ResponseCache())
+
+        first = api.make_request("http://openlibrary.org/search.json?q=test")
+        second = api.make_request("http://openlibrary.org/search.json?q=test")
+
+        self.assertEqual(first, second)
+        mock_get.assert_called_once()
+        self.assertEqual(api.cache.hits, 1)
+        api.close()
+
+    @patch.object(requests.Session, "get")
+    def test_cached_results_are_copies(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"docs":[{"title":"Dune", "language":["eng"]}]}
+        mock_get.return_value = mock_response
+        api = Books_API(cache=ResponseCache())
+
+        api.search_books("Dune").clear()
+        api.get_book_info("Dune")[0]["language"].append("fre")
+
+        self.assertEqual(api.search_books("Dune"), [{"title":"Dune", "language":["eng"]}])
+        self.assertEqual(api.get_book_info("Dune"), [{"title":"Dune", "language":["eng"]}])
+        api.close()
+
+    @patch.object(requests.Session, "get")
+    def test_make_request_errors_not_cached(self, mock_get):
+        mock_get.side_effect = requests.exceptions.ConnectionError("Mocked Connection Error")
+        api = Books_API(cache=ResponseCache())
+
+        api.make_request("http://failurl")
+        api.make_request("http://failurl")
+
+        self.assertEqual(mock_get.call_count, 2)
+        api.close()
+
+    def test_build_url(self):
+        url = self.api.build_url(("title", "language"), q="War & Peace?")
+        self.assertEqual(url, "http://openlibrary.org/search.json?q=War%20%26%20Peace%3F&fields=title%2Clanguage")
+
+    def test_build_url_result_limit(self):
+        api = Books_API(result_limit=20)
+        self.assertTrue(api.build_url(("title",), q="a").endswith("&limit=20"))
+        self.assertTrue(api.build_url(("title",), limit=1, q="a").endswith("&limit=1"))
+        api.close()
+
+    @patch.object(Books_API,"make_request")
+    def test_methods_request_their_fields(self, mock_make_request):
+        mock_make_request.return_value = None
+        self.api.is_book_available("Dune")
+        self.assertEqual(mock_make_request.call_args[0][0],
+            "http://openlibrary.org/search.json?q=Dune&fields=key&limit=1")
+        self.api.books_by_author("Frank Herbert")
+        self.assertEqual(mock_make_request.call_args[0][0],
+            "http://openlibrary.org/search.json?page=1&author=Frank%20Herbert&fields=title_suggest&limit=100")
+        self.api.get_ebooks("Dune")
+        self.assertEqual(mock_make_request.call_args[0][0],
+            "http://openlibrary.org/search.json?q=Dune&fields=title%2Cebook_count_i")
+
     @patch.object(Books_API,"make_request")
     def test_is_book_available_true(self,mock_make_request):
         mock_make_request.return_value = {"docs": [{"title":"Some Book"}]}
@@ -78,6 +184,32 @@ class TestBooks_API(unittest.TestCase):
         result = self.api.books_by_author("Jsonovitch Bosch")
         self.assertEqual(result,[])
 
+    @patch.object(Books_API,"make_request")
+    def test_iter_books_by_author_pages(self, mock_make_request):
+        mock_make_request.side_effect = [
+            {"numFound": 5, "docs": [{"title_suggest": "Book 1"}, {"title_suggest": "Book 2"}]},
+            {"numFound": 5, "docs": [{"title_suggest": "Book 3"}, {"title_suggest": "Book 4"}]},
+            {"numFound": 5, "docs": [{"title_suggest": "Book 5"}]}
+        ]
+        result = list(self.api.iter_books_by_author("Some Author", page_size=2))
+        self.assertEqual(result, ["Book 1", "Book 2", "Book 3", "Book 4", "Book 5"])
+        self.assertIn("page=3", mock_make_request.call_args[0][0])
+
+    @patch.object(Books_API,"make_request")
+    def test_iter_books_by_author_stops_early(self, mock_make_request):
+        mock_make_request.return_value = {"numFound": 100, "docs": [{"title_suggest": "Book 1"}, {"title_suggest": "Book 2"}]}
+        titles = self.api.iter_books_by_author("Some Author", page_size=2)
+        self.assertEqual(next(titles), "Book 1")
+        mock_make_request.assert_called_once()
+
+    @patch.object(Books_API,"make_request")
+    def test_iter_books_by_author_exact_pages(self, mock_make_request):
+        mock_make_request.side_effect = [
+            {"numFound": 2, "docs": [{"title_suggest": "Book 1"}, {"title_suggest": "Book 2"}]}
+        ]
+        result = list(self.api.iter_books_by_author("Some Author", page_size=2))
+        self.assertEqual(result, ["Book 1", "Book 2"])
+
     @patch.object(Books_API,"make_request")
     def test_get_book_info(self, mock_make_request):
         mock_make_request.return_value = {
@@ -98,6 +230,17 @@ class TestBooks_API(unittest.TestCase):
         result = self.api.get_book_info("Why I Hate Json: A Memoir")
         self.assertEqual(result,[])
 
+    @patch.object(Books_API,"make_request")
+    def test_search_books(self, mock_make_request):
+        mock_make_request.return_value = {"docs": [{"title": "Book 1", "ebook_count_i": 2}]}
+        result = self.api.search_books("Book 1")
+        self.assertEqual(result, [{"title": "Book 1", "ebook_count_i": 2}])
+
+    @patch.object(Books_API,"make_request")
+    def test_search_books_no_json(self, mock_make_request):
+        mock_make_request.return_value = None
+        self.assertEqual(self.api.search_books("Book 1"), [])
+
     @patch.object(Books_API,"make_request")
     def test_get_ebooks(self,mock_make_request):
         mock_make_request.return_value = {
@@ -117,7 +260,93 @@ class TestBooks_API(unittest.TestCase):
 
     def tearDown(self):
         # destroy mocks (don't really need?)
-        pass
+        self.api.close()
 
     
-        
\ No newline at end of file
+        
+
+class StubSearchHandler(BaseHTTPRequestHandler):
+    """Serves canned search.json responses after a short delay."""
+
+    DELAY = 0.2
+
+    def do_GET(self):
+        time.sleep(self.DELAY)
+        query = parse_qs(urlsplit(self.path).query)
+        if 'author' in query:
+            docs = [{"title_suggest": "Book 1"}, {"title_suggest": "Book 2"}]
+        elif query.get('q') == ['missing']:
+            docs = []
+        else:
+            docs = [{"title": query['q'][0], "ebook_count_i": 1, "language": ["eng"]}]
+        body = json.dumps({"docs": docs}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestAsyncBooks_API(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubSearchHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    def setUp(self):
+        self.async_api = AsyncBooks_API(max_concurrency=10)
+        self.async_api.api.API_URL = "http://127.0.0.1:%d/search.json" % self.server.server_port
+
+    def test_same_results_as_books_api(self):
+        async def lookups():
+            return await asyncio.gather(
+                self.async_api.is_book_available("dune"),
+                self.async_api.is_book_available("missing"),
+                self.async_api.books_by_author("someone"),
+                self.async_api.get_book_info("dune"),
+                self.async_api.get_ebooks("dune"))
+        available, missing, by_author, info, ebooks = asyncio.run(lookups())
+        self.assertTrue(available)
+        self.assertFalse(missing)
+        self.assertEqual(by_author, ["Book 1", "Book 2"])
+        self.assertEqual(info, [{"title": "dune", "language": ["eng"]}])
+        self.assertEqual(ebooks, [{"title": "dune", "ebook_count": 1}])
+
+    def test_lookups_overlap(self):
+        async def lookups():
+            titles = ["title %d" % i for i in range(10)]
+            return await asyncio.gather(*[self.async_api.is_book_available(t) for t in titles])
+        start = time.monotonic()
+        results = asyncio.run(lookups())
+        elapsed = time.monotonic() - start
+        self.assertEqual(results, [True] * 10)
+        #ten serial requests would take at least 10 * DELAY
+        self.assertLess(elapsed, 5 * StubSearchHandler.DELAY)
+
+    def test_reused_across_event_loops(self):
+        async def lookups():
+            titles = ["title %d" % i for i in range(25)]
+            return await asyncio.gather(*[self.async_api.is_book_available(t) for t in titles])
+        #more lookups than max_concurrency, on two different event loops
+        self.assertEqual(asyncio.run(lookups()), [True] * 25)
+        self.assertEqual(asyncio.run(lookups()), [True] * 25)
+
+    def test_async_context_manager(self):
+        async def use():
+            async with AsyncBooks_API(max_concurrency=2) as api:
+                api.api.API_URL = self.async_api.api.API_URL
+                return await api.is_book_available("dune")
+        self.assertTrue(asyncio.run(use()))
+
+    def tearDown(self):
+        self.async_api.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
@@ -1,7 +1,10 @@
+import io
 import unittest
-from unittest.mock import Mock, patch
+from unittest.mock import MagicMock, Mock, patch
 
-from library.library import Library
+import requests
+from library.ext_api_interface import Books_API, BooksAPIException
+from library.library import InvalidCirculationException, Library
 from library.patron import Patron
 
 
@@ -9,13 +12,13 @@ class TestLibrary(unittest.TestCase):
 
     @patch('library.library_db_interface.TinyDB')
     def setUp(self, mock_tinydb):
-        mock_db_instance = Mock()
+        mock_db_instance = MagicMock()
         mock_tinydb.return_value = mock_db_instance
 
         self.library = Library()
 
         self.mock_db = Mock()
-        self.mock_api = Mock()
+        self.mock_api = MagicMock()
 
         self.library.db = self.mock_db
         self.library.api = self.mock_api
@@ -29,6 +32,13 @@ class TestLibrary(unittest.TestCase):
         result = self.library.is_ebook("test book")
         self.assertTrue(result)
 
+    def test_is_ebook_found_normalized(self):
+        self.mock_api.get_ebooks.return_value = [
+            {'title': 'Caf\u00e9  Society', 'ebook_count': 1}
+        ]
+        result = self.library.is_ebook("CAFE\u0301 society")
+        self.assertTrue(result)
+
     def test_is_ebook_not_found(self):
         self.mock_api.get_ebooks.return_value = []
         result = self.library.is_ebook("Test Book")
@@ -43,12 +53,19 @@ class TestLibrary(unittest.TestCase):
         self.assertEqual(result, 5)
 
     def test_is_book_by_author_found(self):
-        self.mock_api.books_by_author.return_value = ["Test Book"]
+        self.mock_api.iter_books_by_author.return_value = iter(["Test Book"])
         result = self.library.is_book_by_author("Test Author", "test book")
         self.assertTrue(result)
 
+    def test_is_book_by_author_stops_at_match(self):
+        titles = iter(["Other Book", "Test Book", "Never Read"])
+        self.mock_api.iter_books_by_author.return_value = titles
+        result = self.library.is_book_by_author("Test Author", "test book")
+        self.assertTrue(result)
+        self.assertEqual(list(titles), ["Never Read"])
+
     def test_is_book_by_author_not_found(self):
-        self.mock_api.books_by_author.return_value = []
+        self.mock_api.iter_books_by_author.return_value = iter([])
         result = self.library.is_book_by_author("Test Author", "Test Book")
         self.assertFalse(result)
 
@@ -60,6 +77,64 @@ class TestLibrary(unittest.TestCase):
         result = self.library.get_languages_for_book("Test Book")
         self.assertEqual(result, {'eng', 'spa'})
 
+    def test_get_book_profile(self):
+        self.mock_api.search_books.return_value = [
+            {'title': 'Test Book', 'ebook_count_i': 3, 'language': ['eng', 'spa'],
+             'publisher': ['Pub A'], 'publish_year': [1999, 2001]},
+            {'title': 'Test Book Vol 2', 'ebook_count_i': 2, 'language': ['eng']},
+            {'title': 'Test Book Notes', 'ebook_count_i': 0, 'publisher': ['Pub B']}
+        ]
+        result = self.library.get_book_profile("test book")
+        self.assertEqual(result, {'is_ebook': True, 'ebook_count': 5, 'languages': {'eng', 'spa'},
+            'publishers': {'Pub A', 'Pub B'}, 'publish_years': {1999, 2001}})
+        self.mock_api.search_books.assert_called_once_with("test book")
+
+    def test_get_book_profile_not_ebook(self):
+        self.mock_api.search_books.return_value = [{'title': 'Test Book', 'ebook_count_i': 0}]
+        result = self.library.get_book_profile("Test Book")
+        self.assertFalse(result['is_ebook'])
+        self.assertEqual(result['ebook_count'], 0)
+
+    def test_get_ebooks_counts(self):
+        counts = {'Book A': [{'title': 'Book A', 'ebook_count': 2}], 'Book B': []}
+        self.mock_api.get_ebooks.side_effect = lambda book: counts[book]
+        results, errors = self.library.get_ebooks_counts(['Book B', 'Book A', 'Book B'], max_workers=2)
+        self.assertEqual(list(results.items()), [('Book B', 0), ('Book A', 2)])
+        self.assertEqual(errors, {})
+        self.assertEqual(self.mock_api.get_ebooks.call_count, 2)
+
+    def test_get_ebooks_counts_normalized_duplicates(self):
+        self.mock_api.get_ebooks.return_value = [{'title': 'Dune', 'ebook_count': 3}]
+        results, errors = self.library.get_ebooks_counts(['Dune', 'dune', ' DUNE '])
+        self.assertEqual(results, {'Dune': 3, 'dune': 3, ' DUNE ': 3})
+        self.assertEqual(errors, {})
+        self.mock_api.get_ebooks.assert_called_once_with('Dune')
+
+    def test_get_languages_for_books_errors(self):
+        def get_book_info(book):
+            if book == 'Bad Book':
+                raise ValueError("bad response")
+            return [{'title': book, 'language': ['eng']}]
+        self.mock_api.get_book_info.side_effect = get_book_info
+        results, errors = self.library.get_languages_for_books(['Test Book', 'Bad Book'])
+        self.assertEqual(results, {'Test Book': {'eng'}})
+        self.assertEqual(list(errors), ['Bad Book'])
+        self.assertIsInstance(errors['Bad Book'], ValueError)
+
+    @patch.object(requests.Session, "get")
+    def test_get_ebooks_counts_network_errors(self, mock_get):
+        mock_get.side_effect = requests.exceptions.ReadTimeout("Mocked Timeout")
+        self.library.api = Books_API()
+        results, errors = self.library.get_ebooks_counts(['Dune', 'Emma'])
+        self.assertEqual(results, {})
+        self.assertEqual(list(errors), ['Dune', 'Emma'])
+        self.assertIsInstance(errors['Dune'], BooksAPIException)
+        #outside the batch the API still returns empty results
+        self.assertEqual(self.library.get_ebooks_count('Dune'), 0)
+
+    def test_get_languages_for_books_empty(self):
+        self.assertEqual(self.library.get_languages_for_books([]), ({}, {}))
+
     @patch('library.library.Patron')
     def test_register_patron(self, mock_patron_class):
         mock_patron_instance = Mock()
@@ -69,6 +144,83 @@ class TestLibrary(unittest.TestCase):
         result = self.library.register_patron("Uttam", "Bhattarai", 23, "12345")
         self.assertEqual(result, 1)
 
+    def test_register_patrons(self):
+        self.mock_db.insert_patrons.return_value = [1, None]
+        records = [
+            {'fname': 'Uttam', 'lname': 'Bhattarai', 'age': 23, 'memberID': '12345'},
+            {'fname': 'R2D2', 'lname': 'Droid', 'age': 40, 'memberID': '22222'},
+            {'fname': 'Uttam', 'lname': 'Bhattarai', 'age': 23, 'memberID': '12345'},
+            {'fname': 'Missing', 'lname': 'Age', 'memberID': '33333'}
+        ]
+        result = self.library.register_patrons(records)
+        self.assertEqual(result, [
+            {'memberID': '12345', 'status': Library.INSERTED, 'id': 1},
+            {'memberID': '22222', 'status': Library.INVALID, 'id': None},
+            {'memberID': '12345', 'status': Library.DUPLICATE, 'id': None},
+            {'memberID': '33333', 'status': Library.INVALID, 'id': None}
+        ])
+        inserted = self.mock_db.insert_patrons.call_args[0][0]
+        self.assertEqual([patron.get_memberID() for patron in inserted], ['12345', '12345'])
+
+    def test_register_patrons_from_csv(self):
+        self.mock_db.insert_patrons.return_value = [1]
+        stream = io.StringIO("fname,lname,age,memberID\nUttam,Bhattarai,23,12345\n")
+        result = self.library.register_patrons_from_file(stream)
+        self.assertEqual(result, [{'memberID': '12345', 'status': Library.INSERTED, 'id': 1}])
+        inserted = self.mock_db.insert_patrons.call_args[0][0]
+        self.assertEqual(inserted[0].get_age(), 23)
+
+    def test_register_patrons_from_jsonl(self):
+        self.mock_db.insert_patrons.return_value = [7]
+        stream = io.StringIO('{"fname": "Uttam", "lname": "Bhattarai", "age": 23, "memberID": 5}\n\n')
+        result = self.library.register_patrons_from_file(stream, 'jsonl')
+        self.assertEqual(result, [{'memberID': 5, 'status': Library.INSERTED, 'id': 7}])
+
+    def test_register_patrons_missing_values(self):
+        self.mock_db.insert_patrons.return_value = []
+        records = [
+            {'fname': 'Uttam', 'lname': 'Bhattarai', 'age': 23, 'memberID': None},
+            {'fname': None, 'lname': 'Bhattarai', 'age': 23, 'memberID': '12345'}
+        ]
+        result = self.library.register_patrons(records)
+        self.assertEqual(result, [
+            {'memberID': None, 'status': Library.INVALID, 'id': None},
+            {'memberID': '12345', 'status': Library.INVALID, 'id': None}
+        ])
+        self.mock_db.insert_patrons.assert_called_once_with([])
+
+    def test_register_patrons_not_a_dictionary(self):
+        self.mock_db.insert_patrons.return_value = []
+        result = self.library.register_patrons([('Uttam', 'Bhattarai', 23, '12345')])
+        self.assertEqual(result, [{'memberID': None, 'status': Library.INVALID, 'id': None}])
+
+    def test_register_patrons_from_csv_short_row(self):
+        self.mock_db.insert_patrons.return_value = [1]
+        stream = io.StringIO("fname,lname,age,memberID\nA,B\nUttam,Bhattarai,23,12345\n")
+        result = self.library.register_patrons_from_file(stream)
+        self.assertEqual(result, [
+            {'memberID': None, 'status': Library.INVALID, 'id': None},
+            {'memberID': '12345', 'status': Library.INSERTED, 'id': 1}
+        ])
+
+    def test_register_patrons_from_jsonl_bad_lines(self):
+        self.mock_db.insert_patrons.return_value = [7]
+        stream = io.StringIO('{"fname": "Uttam", "lname": "Bhattarai", "age": 23, "memberID": 5}\n'
+                             '{"fname": "Uttam", \n'
+                             '["Uttam", "Bhattarai", 23, 6]\n'
+                             '{"fname": "Uttam", "lname": "Bhattarai", "age": 23, "memberID": null}\n')
+        result = self.library.register_patrons_from_file(stream, 'jsonl')
+        self.assertEqual(result, [
+            {'memberID': 5, 'status': Library.INSERTED, 'id': 7},
+            {'memberID': None, 'status': Library.INVALID, 'id': None},
+            {'memberID': None, 'status': Library.INVALID, 'id': None},
+            {'memberID': None, 'status': Library.INVALID, 'id': None}
+        ])
+
+    def test_register_patrons_from_unknown_format(self):
+        with self.assertRaises(ValueError):
+            self.library.register_patrons_from_file(io.StringIO(""), 'xml')
+
     def test_is_patron_registered_true(self):
         self.mock_db.retrieve_patron.return_value = self.test_patron
         result = self.library.is_patron_registered(self.test_patron)
@@ -83,24 +235,75 @@ class TestLibrary(unittest.TestCase):
         mock_patron = Mock()
         self.library.borrow_book("Test Book", mock_patron)
         mock_patron.add_borrowed_book.assert_called_with("test book")
+        self.mock_db.add_borrowed_book.assert_called_once_with(mock_patron.get_memberID(), "test book")
+        self.mock_db.update_patron.assert_not_called()
 
     def test_return_borrowed_book(self):
         mock_patron = Mock()
         self.library.return_borrowed_book("Test Book", mock_patron)
         mock_patron.return_borrowed_book.assert_called_with("test book")
+        self.mock_db.remove_borrowed_book.assert_called_once_with(mock_patron.get_memberID(), "test book")
+        self.mock_db.update_patron.assert_not_called()
+
+    def test_apply_circulation(self):
+        other_patron = Patron("Jane", "Doe", 30, "54321")
+        other_patron.add_borrowed_book("old book")
+        self.mock_db.retrieve_patrons.return_value = [self.test_patron, other_patron]
+        events = [
+            ("12345", "Book A", Library.BORROW),
+            ("54321", "Old Book", Library.RETURN),
+            ("12345", "Book B", Library.BORROW),
+            ("12345", "book a", Library.RETURN)
+        ]
+        result = self.library.apply_circulation(events)
+
+        self.assertEqual(list(result), ["12345", "54321"])
+        self.assertEqual(result["12345"].get_borrowed_books(), ["book b"])
+        self.assertEqual(result["54321"].get_borrowed_books(), [])
+        self.assertEqual(list(self.mock_db.retrieve_patrons.call_args[0][0]), ["12345", "54321"])
+        self.mock_db.update_patrons.assert_called_once()
+        self.assertEqual(list(self.mock_db.update_patrons.call_args[0][0]), [self.test_patron, other_patron])
+
+    def test_apply_circulation_bad_action(self):
+        with self.assertRaises(InvalidCirculationException):
+            self.library.apply_circulation([("12345", "Book A", "renew")])
+        self.mock_db.update_patrons.assert_not_called()
+
+    def test_apply_circulation_unknown_patron(self):
+        self.mock_db.retrieve_patrons.return_value = [self.test_patron, None]
+        events = [("12345", "Book A", Library.BORROW), ("99999", "Book B", Library.BORROW)]
+        with self.assertRaises(InvalidCirculationException):
+            self.library.apply_circulation(events)
+        self.mock_db.update_patrons.assert_not_called()
+
+    def test_who_has(self):
+        self.mock_db.get_holders.return_value = {"12345"}
+        self.assertEqual(self.library.who_has("Test Book"), {"12345"})
+        self.mock_db.get_holders.assert_called_once_with("test book")
+
+    def test_copies_out(self):
+        self.mock_db.count_holders.return_value = 2
+        self.assertEqual(self.library.copies_out("Test Book"), 2)
+        self.mock_db.count_holders.assert_called_once_with("test book")
 
     def test_is_book_borrowed_true(self):
         mock_patron = Mock()
-        mock_patron.get_borrowed_books.return_value = ["test book"]
+        mock_patron.has_borrowed_book.return_value = True
         result = self.library.is_book_borrowed("Test Book", mock_patron)
         self.assertTrue(result)
+        mock_patron.has_borrowed_book.assert_called_once_with("test book")
 
     def test_is_book_borrowed_false(self):
         mock_patron = Mock()
-        mock_patron.get_borrowed_books.return_value = []
+        mock_patron.has_borrowed_book.return_value = False
         result = self.library.is_book_borrowed("Test Book", mock_patron)
         self.assertFalse(result)
 
+    def test_is_book_borrowed_real_patron(self):
+        self.test_patron.add_borrowed_book("Test Book")
+        self.assertTrue(self.library.is_book_borrowed("TEST BOOK", self.test_patron))
+        self.assertFalse(self.library.is_book_borrowed("Other Book", self.test_patron))
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
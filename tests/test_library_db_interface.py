@@ -3,7 +3,11 @@ from unittest.mock import MagicMock, Mock, patch
 
 from library import library_db_interface;
 from library.patron import Patron
+from tinydb.database import Document
+import json
 import os
+import shutil
+import tempfile
 
 class TestLibraryDB_API(unittest.TestCase):
     
@@ -43,12 +47,88 @@ class TestLibraryDB_API(unittest.TestCase):
     def test_update_patron_success(self, mock_tinydb):
         mock_db_instance = MagicMock()
         mock_tinydb.return_value = mock_db_instance
+        mock_db_instance.__iter__.return_value = iter([
+            Document({'fname': 'John', 'lname': 'Doe', 'age': 25, 'memberID': 'P001', 'borrowed_books': []}, 1)
+        ])
         lib_db = library_db_interface.Library_DB()
 
         patron = Patron("John", "Doe", 25, "P001")
         lib_db.update_patron(patron)
 
         mock_db_instance.update.assert_called_once()
+        self.assertEqual(mock_db_instance.update.call_args[1], {'doc_ids': [1]})
+
+    @patch('library.library_db_interface.TinyDB')
+    def test_update_patron_not_in_db(self, mock_tinydb):
+        mock_db_instance = MagicMock()
+        mock_tinydb.return_value = mock_db_instance
+        lib_db = library_db_interface.Library_DB()
+
+        result = lib_db.update_patron(Patron("John", "Doe", 25, "P001"))
+
+        self.assertIsNone(result)
+        mock_db_instance.update.assert_not_called()
+
+    @patch('library.library_db_interface.TinyDB')
+    def test_update_patrons(self, mock_tinydb):
+        mock_db_instance = MagicMock()
+        mock_tinydb.return_value = mock_db_instance
+        docs = {
+            1: Document({'fname': 'John', 'lname': 'Doe', 'age': 25, 'memberID': 'P001', 'borrowed_books': []}, 1),
+            2: Document({'fname': 'Jane', 'lname': 'Doe', 'age': 23, 'memberID': 'P002', 'borrowed_books': []}, 2)
+        }
+        mock_db_instance.__iter__.return_value = iter(docs.values())
+        mock_db_instance.update.side_effect = lambda change, doc_ids: [change(docs[i]) for i in doc_ids]
+        lib_db = library_db_interface.Library_DB()
+
+        john = Patron("John", "Doe", 26, "P001")
+        john.add_borrowed_book("dune")
+        result = lib_db.update_patrons([john, Patron("Jim", "Doe", 40, "P003")])
+
+        self.assertEqual(result, ["P001"])
+        mock_db_instance.update.assert_called_once()
+        self.assertEqual(docs[1]['age'], 26)
+        self.assertEqual(docs[1]['borrowed_books'], ['dune'])
+        self.assertEqual(docs[2]['age'], 23)
+
+    @patch('library.library_db_interface.TinyDB')
+    def test_update_patrons_none_found(self, mock_tinydb):
+        mock_db_instance = MagicMock()
+        mock_tinydb.return_value = mock_db_instance
+        lib_db = library_db_interface.Library_DB()
+
+        self.assertEqual(lib_db.update_patrons([Patron("Jim", "Doe", 40, "P003")]), [])
+        mock_db_instance.update.assert_not_called()
+
+    @patch('library.library_db_interface.TinyDB')
+    def test_add_and_remove_borrowed_book(self, mock_tinydb):
+        mock_db_instance = MagicMock()
+        mock_tinydb.return_value = mock_db_instance
+        doc = Document({'fname': 'John', 'lname': 'Doe', 'age': 25, 'memberID': 'P001', 'borrowed_books': ['emma']}, 1)
+        mock_db_instance.__iter__.return_value = iter([doc])
+        #apply the change function like TinyDB would
+        mock_db_instance.update.side_effect = lambda change, doc_ids: change(doc)
+        lib_db = library_db_interface.Library_DB()
+
+        self.assertTrue(lib_db.add_borrowed_book("P001", "dune"))
+        self.assertTrue(lib_db.add_borrowed_book("P001", "dune"))
+        self.assertEqual(doc['borrowed_books'], ['emma', 'dune'])
+        self.assertTrue(lib_db.remove_borrowed_book("P001", "emma"))
+        self.assertTrue(lib_db.remove_borrowed_book("P001", "emma"))
+        self.assertEqual(doc['borrowed_books'], ['dune'])
+        self.assertEqual(doc['fname'], 'John')
+        for call in mock_db_instance.update.call_args_list:
+            self.assertEqual(call[1], {'doc_ids': [1]})
+
+    @patch('library.library_db_interface.TinyDB')
+    def test_add_borrowed_book_unknown_patron(self, mock_tinydb):
+        mock_db_instance = MagicMock()
+        mock_tinydb.return_value = mock_db_instance
+        lib_db = library_db_interface.Library_DB()
+
+        self.assertFalse(lib_db.add_borrowed_book("NOPE", "dune"))
+        self.assertFalse(lib_db.remove_borrowed_book("NOPE", "dune"))
+        mock_db_instance.update.assert_not_called()
 
     @patch('library.library_db_interface.TinyDB')
     def test_update_patron_invalid(self, mock_tinydb):
@@ -61,30 +141,88 @@ class TestLibraryDB_API(unittest.TestCase):
         mock_db_instance = MagicMock()
         mock_tinydb.return_value = mock_db_instance
 
+        mock_db_instance.insert.return_value = 1
         lib_db = library_db_interface.Library_DB()
         patron = Patron("John", "Doe", 25, "P001")
 
-        #Mock into returning the patron we just made (a dupe!)
-        lib_db.retrieve_patron = MagicMock(return_value=patron)
-
+        #Insert once, then try again with the patron we just made (a dupe!)
+        self.assertEqual(lib_db.insert_patron(patron), 1)
         result = lib_db.insert_patron(patron)
 
         self.assertIsNone(result)
-        mock_db_instance.insert.assert_not_called()
+        mock_db_instance.insert.assert_called_once()
     
     @patch('library.library_db_interface.TinyDB')
-    def test_get_patron_count(self, mock_tinydb):
+    def test_insert_patrons(self, mock_tinydb):
         mock_db_instance = MagicMock()
         mock_tinydb.return_value = mock_db_instance
-        mock_db_instance.all.return_value = [
-            {'fname': 'John', 'lname': 'Doe', 'age': 25, 'memberID': 'P001'},
-            {'fname': 'Jane', 'lname': 'Doe', 'age': 23, 'memberID': 'P002'}
+        mock_db_instance.__iter__.return_value = iter([
+            Document({'fname': 'John', 'lname': 'Doe', 'age': 25, 'memberID': 'P001', 'borrowed_books': []}, 1)
+        ])
+        mock_db_instance.insert_multiple.return_value = [2, 3]
+        lib_db = library_db_interface.Library_DB()
+
+        patrons = [
+            Patron("John", "Doe", 25, "P001"), # already in db
+            Patron("Jane", "Doe", 23, "P002"),
+            None,
+            Patron("Jane", "Smith", 30, "P002"), # dupe in the batch
+            Patron("Jim", "Doe", 40, "P003")
         ]
+        result = lib_db.insert_patrons(patrons)
+
+        self.assertEqual(result, [None, 2, None, None, 3])
+        mock_db_instance.insert_multiple.assert_called_once()
+        inserted = mock_db_instance.insert_multiple.call_args[0][0]
+        self.assertEqual([data['memberID'] for data in inserted], ['P002', 'P003'])
+        #the new patrons are now known to the db
+        self.assertIsNone(lib_db.insert_patron(Patron("Jim", "Doe", 40, "P003")))
+
+    @patch('library.library_db_interface.TinyDB')
+    def test_insert_patrons_all_skipped(self, mock_tinydb):
+        mock_db_instance = MagicMock()
+        mock_tinydb.return_value = mock_db_instance
+        lib_db = library_db_interface.Library_DB()
+
+        self.assertEqual(lib_db.insert_patrons([None]), [None])
+        mock_db_instance.insert_multiple.assert_not_called()
+
+    @patch('library.library_db_interface.TinyDB')
+    def test_get_patron_count(self, mock_tinydb):
+        mock_db_instance = MagicMock()
+        mock_tinydb.return_value = mock_db_instance
+        mock_db_instance.__iter__.return_value = iter([
+            Document({'fname': 'John', 'lname': 'Doe', 'age': 25, 'memberID': 'P001'}, 1),
+            Document({'fname': 'Jane', 'lname': 'Doe', 'age': 23, 'memberID': 'P002'}, 2)
+        ])
+        mock_db_instance.insert.return_value = 3
         
         lib_db = library_db_interface.Library_DB()
         result = lib_db.get_patron_count()
         self.assertEqual(result, 2)
-        mock_db_instance.all.assert_called_once()
+        lib_db.insert_patron(Patron("Jim", "Doe", 40, "P003"))
+        self.assertEqual(lib_db.get_patron_count(), 3)
+        mock_db_instance.all.assert_not_called()
+
+    @patch('library.library_db_interface.TinyDB')
+    def test_iter_patrons(self, mock_tinydb):
+        mock_db_instance = MagicMock()
+        mock_tinydb.return_value = mock_db_instance
+        docs = [
+            Document({'fname': 'John', 'lname': 'Doe', 'age': 25, 'memberID': 'P001', 'borrowed_books': ['dune']}, 1),
+            Document({'fname': 'Jane', 'lname': 'Doe', 'age': 23, 'memberID': 'P002', 'borrowed_books': []}, 2),
+            Document({'fname': 'Jim', 'lname': 'Doe', 'age': 40, 'memberID': 'P003', 'borrowed_books': []}, 3)
+        ]
+        mock_db_instance.__iter__.side_effect = lambda: iter(docs)
+        lib_db = library_db_interface.Library_DB()
+
+        patrons = list(lib_db.iter_patrons())
+        self.assertEqual([patron.get_memberID() for patron in patrons], ['P001', 'P002', 'P003'])
+        self.assertEqual(patrons[0].get_borrowed_books(), ['dune'])
+
+        chunks = list(lib_db.iter_patrons(chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+        mock_db_instance.all.assert_not_called()
 
     
     @patch('library.library_db_interface.TinyDB')
@@ -93,9 +231,9 @@ class TestLibraryDB_API(unittest.TestCase):
         mock_tinydb.return_value = mock_db_instance
         
         #successful/expected result
-        mock_db_instance.search.return_value = [
-            {'fname': 'John', 'lname': 'Doe', 'age': 25, 'memberID': 'P001', 'borrowed_books': []}
-        ]
+        doc = Document({'fname': 'John', 'lname': 'Doe', 'age': 25, 'memberID': 'P001', 'borrowed_books': []}, 1)
+        mock_db_instance.__iter__.return_value = iter([doc])
+        mock_db_instance.get.return_value = doc
         
         lib_db = library_db_interface.Library_DB()
         result = lib_db.retrieve_patron("P001")
@@ -106,20 +244,62 @@ class TestLibraryDB_API(unittest.TestCase):
         self.assertEqual(result.get_fname(), "John")
         self.assertEqual(result.get_lname(), "Doe")
         self.assertEqual(result.get_age(), 25)
-        mock_db_instance.search.assert_called_once()
+        mock_db_instance.get.assert_called_once_with(doc_id=1)
+        mock_db_instance.search.assert_not_called()
     
+    @patch('library.library_db_interface.TinyDB')
+    def test_retrieve_patron_borrowed_books(self, mock_tinydb):
+        mock_db_instance = MagicMock()
+        mock_tinydb.return_value = mock_db_instance
+        doc = Document({'fname': 'John', 'lname': 'Doe', 'age': 25, 'memberID': 'P001',
+                        'borrowed_books': ['dune', 'emma']}, 1)
+        mock_db_instance.__iter__.return_value = iter([doc])
+        mock_db_instance.get.return_value = doc
+
+        lib_db = library_db_interface.Library_DB()
+        result = lib_db.retrieve_patron("P001")
+
+        self.assertEqual(result.get_borrowed_books(), ['dune', 'emma'])
+
+    @patch('library.library_db_interface.TinyDB')
+    def test_retrieve_patrons(self, mock_tinydb):
+        mock_db_instance = MagicMock()
+        mock_tinydb.return_value = mock_db_instance
+        docs = [
+            Document({'fname': 'John', 'lname': 'Doe', 'age': 25, 'memberID': 'P001', 'borrowed_books': ['dune']}, 1),
+            Document({'fname': 'Jane', 'lname': 'Doe', 'age': 23, 'memberID': 'P002', 'borrowed_books': []}, 2),
+            Document({'fname': 'Jim', 'lname': 'Doe', 'age': 40, 'memberID': 'P003', 'borrowed_books': []}, 3)
+        ]
+        #once to build the index, once for retrieve_patrons
+        mock_db_instance.__iter__.side_effect = [iter(docs), iter(docs)]
+
+        lib_db = library_db_interface.Library_DB()
+        result = lib_db.retrieve_patrons(["P003", "NOPE", "P001"])
+
+        self.assertEqual([patron.get_fname() if patron else None for patron in result], ["Jim", None, "John"])
+        self.assertEqual(result[2].get_borrowed_books(), ['dune'])
+        mock_db_instance.get.assert_not_called()
+
+    @patch('library.library_db_interface.TinyDB')
+    def test_retrieve_patrons_none_found(self, mock_tinydb):
+        mock_db_instance = MagicMock()
+        mock_tinydb.return_value = mock_db_instance
+        lib_db = library_db_interface.Library_DB()
+
+        self.assertEqual(lib_db.retrieve_patrons(["NOPE"]), [None])
+
     @patch('library.library_db_interface.TinyDB')
     def test_retrieve_patron_invalid(self, mock_tinydb):
         mock_db_instance = MagicMock()
         mock_tinydb.return_value = mock_db_instance
         
         #Mock empty (not found)
-        mock_db_instance.search.return_value = []
+        mock_db_instance.__iter__.return_value = iter([])
         
         lib_db = library_db_interface.Library_DB()
         result = lib_db.retrieve_patron("INVALID_ID")
         self.assertIsNone(result)
-        mock_db_instance.search.assert_called_once()
+        mock_db_instance.get.assert_not_called()
     
     @patch('library.library_db_interface.TinyDB')
     def test_retrieve_patron_insert_duplicate_id_first(self, mock_tinydb):
@@ -127,10 +307,12 @@ class TestLibraryDB_API(unittest.TestCase):
         mock_tinydb.return_value = mock_db_instance
 
         #First I add two patrons with the same ID
-        mock_db_instance.search.return_value = [
-            {'fname': 'John', 'lname': 'Doe', 'age': 25, 'memberID': 'P001', 'borrowed_books': []},
-            {'fname': 'Jane', 'lname': 'Smith', 'age': 30, 'memberID': 'P001', 'borrowed_books': []}  # Duplicate ID
+        docs = [
+            Document({'fname': 'John', 'lname': 'Doe', 'age': 25, 'memberID': 'P001', 'borrowed_books': []}, 1),
+            Document({'fname': 'Jane', 'lname': 'Smith', 'age': 30, 'memberID': 'P001', 'borrowed_books': []}, 2)  # Duplicate ID
         ]
+        mock_db_instance.__iter__.return_value = iter(docs)
+        mock_db_instance.get.side_effect = lambda doc_id: docs[doc_id - 1]
         
         lib_db = library_db_interface.Library_DB()
         
@@ -143,7 +325,7 @@ class TestLibraryDB_API(unittest.TestCase):
         self.assertEqual(result.get_fname(), "John")
         self.assertEqual(result.get_lname(), "Doe")
         self.assertEqual(result.get_age(), 25)
-        mock_db_instance.search.assert_called_once()
+        mock_db_instance.get.assert_called_once_with(doc_id=1)
 
     #This is the same test as above, I just check to see if any other info comes through
         #Honestly this is moreso useful to improve the codebase than to exhaust testing/coverage
@@ -207,3 +389,102 @@ class TestLibraryDB_API(unittest.TestCase):
 
     
 
+
+
+class TestLibraryDB_File(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'db.json')
+
+    def test_legacy_titles_normalized_on_open(self):
+        with open(self.path, 'w') as db_file:
+            json.dump({'_default': {'1': {'fname': 'John', 'lname': 'Doe', 'age': 25,
+                'memberID': 'P001', 'borrowed_books': ['die straße', 'the  hobbit']}}}, db_file)
+        lib_db = library_db_interface.Library_DB(self.path)
+        self.assertEqual(lib_db.get_holders('die strasse'), {'P001'})
+        self.assertTrue(lib_db.remove_borrowed_book('P001', 'die strasse'))
+        self.assertEqual(lib_db.retrieve_patron('P001').get_borrowed_books(), ['the hobbit'])
+        lib_db.close_db()
+        with open(self.path) as db_file:
+            stored = json.load(db_file)['_default']['1']
+        self.assertEqual(stored['borrowed_books'], ['the hobbit'])
+
+    def test_legacy_titles_not_written_on_open(self):
+        with open(self.path, 'w') as db_file:
+            json.dump({'_default': {'1': {'fname': 'John', 'lname': 'Doe', 'age': 25,
+                'memberID': 'P001', 'borrowed_books': ['Dune']}}}, db_file)
+        with open(self.path, 'rb') as db_file:
+            original = db_file.read()
+        lib_db = library_db_interface.Library_DB(self.path)
+        self.assertEqual(lib_db.get_holders('dune'), {'P001'})
+        self.assertEqual([patron.get_borrowed_books() for patron in lib_db.iter_patrons()],
+            [['dune']])
+        lib_db.close_db()
+        with open(self.path, 'rb') as db_file:
+            self.assertEqual(db_file.read(), original)
+
+    def test_buffered_writes_flush_on_exit(self):
+        with library_db_interface.Library_DB(self.path, buffered=True) as lib_db:
+            lib_db.insert_patron(Patron("John", "Doe", 25, "P001"))
+            lib_db.insert_patron(Patron("Jane", "Doe", 23, "P002"))
+            self.assertEqual(lib_db.retrieve_patron("P002").get_fname(), "Jane")
+            #nothing has reached the file yet
+            with open(self.path) as db_file:
+                self.assertNotIn("P001", db_file.read())
+        with open(self.path) as db_file:
+            contents = db_file.read()
+        self.assertIn("P001", contents)
+        self.assertIn("P002", contents)
+
+    def test_buffered_flush_every(self):
+        #create the empty table first so only patron writes are counted
+        library_db_interface.Library_DB(self.path).close_db()
+        lib_db = library_db_interface.Library_DB(self.path, buffered=True, flush_every=2)
+        lib_db.insert_patron(Patron("John", "Doe", 25, "P001"))
+        lib_db.insert_patron(Patron("Jane", "Doe", 23, "P002"))
+        with open(self.path) as db_file:
+            self.assertIn("P002", db_file.read())
+        lib_db.close_db()
+
+    def test_holders_index(self):
+        lib_db = library_db_interface.Library_DB(self.path)
+        john = Patron("John", "Doe", 25, "P001")
+        john.add_borrowed_book("dune")
+        lib_db.insert_patron(john)
+        lib_db.insert_patrons([Patron("Jane", "Doe", 23, "P002"), Patron("Jim", "Doe", 40, "P003")])
+        self.assertEqual(lib_db.get_holders("dune"), {"P001"})
+
+        lib_db.add_borrowed_book("P002", "dune")
+        lib_db.add_borrowed_book("P003", "emma")
+        self.assertEqual(lib_db.get_holders("dune"), {"P001", "P002"})
+        self.assertEqual(lib_db.count_holders("emma"), 1)
+
+        john.return_borrowed_book("dune")
+        john.add_borrowed_book("emma")
+        lib_db.update_patron(john)
+        self.assertEqual(lib_db.get_holders("dune"), {"P002"})
+        self.assertEqual(lib_db.get_holders("emma"), {"P001", "P003"})
+
+        lib_db.remove_borrowed_book("P002", "dune")
+        self.assertEqual(lib_db.get_holders("dune"), set())
+        self.assertEqual(lib_db.count_holders("dune"), 0)
+        lib_db.close_db()
+
+        #rebuilt the same way when the database is opened again
+        reopened = library_db_interface.Library_DB(self.path)
+        self.assertEqual(reopened.get_holders("emma"), {"P001", "P003"})
+        self.assertEqual(reopened.get_holders("dune"), set())
+        reopened.close_db()
+
+    def test_flush(self):
+        lib_db = library_db_interface.Library_DB(self.path, buffered=True)
+        lib_db.insert_patron(Patron("John", "Doe", 25, "P001"))
+        lib_db.flush()
+        reopened = library_db_interface.Library_DB(self.path)
+        self.assertEqual(reopened.retrieve_patron("P001").get_lname(), "Doe")
+        reopened.close_db()
+        lib_db.close_db()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
@@ -0,0 +1,164 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from library import library_db_interface
+from library.log_db_interface import Log_Library_DB
+from library.patron import Patron
+
+
+class TestLogLibraryDB(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'db.log')
+        self.lib_db = Log_Library_DB(self.path)
+        self.patron = Patron("John", "Doe", 25, "P001")
+
+    def reopen(self):
+        self.lib_db.close_db()
+        self.lib_db = Log_Library_DB(self.path)
+
+    def log_lines(self):
+        with open(self.path, 'rb') as log_file:
+            return log_file.read().splitlines()
+
+    def test_insert_and_retrieve(self):
+        self.assertEqual(self.lib_db.insert_patron(self.patron), 1)
+        self.assertIsNone(self.lib_db.insert_patron(self.patron))
+        self.assertIsNone(self.lib_db.insert_patron(None))
+        self.assertEqual(self.lib_db.retrieve_patron("P001"), self.patron)
+        self.assertIsNone(self.lib_db.retrieve_patron("NOPE"))
+        self.assertEqual(self.lib_db.get_patron_count(), 1)
+
+    def test_insert_patrons_single_append(self):
+        result = self.lib_db.insert_patrons([self.patron, Patron("Jane", "Doe", 23, "P002"),
+            Patron("Jane", "Smith", 30, "P002")])
+        self.assertEqual(result, [1, 2, None])
+        self.assertEqual(len(self.log_lines()), 1)
+
+    def test_borrow_and_return_append_deltas(self):
+        self.lib_db.insert_patron(self.patron)
+        self.assertTrue(self.lib_db.add_borrowed_book("P001", "dune"))
+        self.assertTrue(self.lib_db.add_borrowed_book("P001", "dune"))
+        self.assertTrue(self.lib_db.add_borrowed_book("P001", "emma"))
+        self.assertTrue(self.lib_db.remove_borrowed_book("P001", "dune"))
+        self.assertFalse(self.lib_db.add_borrowed_book("NOPE", "dune"))
+        #insert, two borrows and a return; the repeated borrow isn't logged
+        self.assertEqual(len(self.log_lines()), 4)
+        self.assertLess(len(self.log_lines()[-1]), 80)
+        self.assertEqual(self.lib_db.retrieve_patron("P001").get_borrowed_books(), ["emma"])
+        self.assertEqual(self.lib_db.get_holders("emma"), {"P001"})
+
+    def test_replay_on_open(self):
+        self.lib_db.insert_patrons([self.patron, Patron("Jane", "Doe", 23, "P002")])
+        self.lib_db.add_borrowed_book("P001", "dune")
+        self.lib_db.add_borrowed_book("P002", "dune")
+        updated = Patron("Janet", "Doe", 24, "P002")
+        self.lib_db.update_patron(updated)
+        self.reopen()
+        self.assertEqual(self.lib_db.retrieve_patron("P002"), updated)
+        self.assertEqual(self.lib_db.retrieve_patron("P001").get_borrowed_books(), ["dune"])
+        self.assertEqual(self.lib_db.get_holders("dune"), {"P001"})
+        self.assertEqual(self.lib_db.insert_patron(Patron("Jim", "Doe", 40, "P003")), 3)
+
+    def test_torn_last_line_dropped(self):
+        self.lib_db.insert_patron(self.patron)
+        self.lib_db.close_db()
+        with open(self.path, 'ab') as log_file:
+            log_file.write(b'{"op":"borrow","memberID":"P0')
+        self.lib_db = Log_Library_DB(self.path)
+        self.assertEqual(self.lib_db.retrieve_patron("P001").get_borrowed_books(), [])
+        self.lib_db.add_borrowed_book("P001", "dune")
+        self.reopen()
+        self.assertEqual(self.lib_db.retrieve_patron("P001").get_borrowed_books(), ["dune"])
+
+    def test_legacy_titles_normalized_on_replay(self):
+        self.lib_db.close_db()
+        with open(self.path, 'wb') as log_file:
+            log_file.write('{"op":"insert","id":1,"doc":{"fname":"John","lname":"Doe","age":25,'
+                '"memberID":"P001","borrowed_books":["die straße"]}}\n'
+                '{"op":"borrow","memberID":"P001","book":"the  hobbit"}\n'.encode())
+        self.lib_db = Log_Library_DB(self.path)
+        self.assertEqual(self.lib_db.get_holders("die strasse"), {"P001"})
+        self.assertTrue(self.lib_db.remove_borrowed_book("P001", "die strasse"))
+        self.reopen()
+        self.assertEqual(self.lib_db.retrieve_patron("P001").get_borrowed_books(), ["the hobbit"])
+
+    def test_torn_batch_dropped_whole(self):
+        jane = Patron("Jane", "Doe", 23, "P002")
+        self.lib_db.insert_patrons([self.patron, jane])
+        self.patron.add_borrowed_book("dune")
+        jane.add_borrowed_book("emma")
+        self.lib_db.update_patrons([self.patron, jane])
+        self.lib_db.close_db()
+        #crash inside the second patron of the batch
+        with open(self.path, 'r+b') as log_file:
+            log_file.truncate(os.path.getsize(self.path) - 20)
+        self.lib_db = Log_Library_DB(self.path)
+        self.assertEqual(self.lib_db.retrieve_patron("P001").get_borrowed_books(), [])
+        self.assertEqual(self.lib_db.retrieve_patron("P002").get_borrowed_books(), [])
+
+    def test_failed_write_truncated(self):
+        self.lib_db.insert_patron(self.patron)
+        log = self.lib_db._log
+        def partial_write(data):
+            log.write(bytes(data[:10]))
+            raise OSError("No space left on device")
+        self.lib_db._log = MagicMock(wraps=log)
+        self.lib_db._log.write.side_effect = partial_write
+        with self.assertRaises(OSError):
+            self.lib_db.add_borrowed_book("P001", "dune")
+        self.lib_db._log = log
+        self.assertEqual(self.lib_db.retrieve_patron("P001").get_borrowed_books(), [])
+        self.lib_db.add_borrowed_book("P001", "emma")
+        self.reopen()
+        self.assertEqual(self.lib_db.retrieve_patron("P001").get_borrowed_books(), ["emma"])
+
+    def test_compact(self):
+        self.lib_db.insert_patrons([self.patron, Patron("Jane", "Doe", 23, "P002")])
+        for _ in range(5):
+            self.lib_db.add_borrowed_book("P001", "dune")
+            self.lib_db.remove_borrowed_book("P001", "dune")
+        self.lib_db.add_borrowed_book("P002", "emma")
+        self.lib_db.compact()
+        self.assertEqual(len(self.log_lines()), 2)
+        self.assertEqual(os.listdir(self.tmp_dir), ['db.log'])
+        #still appends after compacting
+        self.lib_db.add_borrowed_book("P001", "dune")
+        self.reopen()
+        self.assertEqual(self.lib_db.get_holders("emma"), {"P002"})
+        self.assertEqual(self.lib_db.retrieve_patron("P001").get_borrowed_books(), ["dune"])
+
+    def test_update_patrons_and_retrieve_patrons(self):
+        self.lib_db.insert_patrons([self.patron, Patron("Jane", "Doe", 23, "P002")])
+        self.patron.add_borrowed_book("dune")
+        self.assertEqual(self.lib_db.update_patrons([self.patron, Patron("Jim", "Doe", 40, "P003")]), ["P001"])
+        result = self.lib_db.retrieve_patrons(["P001", "P003"])
+        self.assertEqual(result, [self.patron, None])
+
+    def test_all_and_iter_patrons(self):
+        self.lib_db.insert_patrons([self.patron, Patron("Jane", "Doe", 23, "P002"), Patron("Jim", "Doe", 40, "P003")])
+        patrons = self.lib_db.get_all_patrons()
+        patrons[0]['borrowed_books'].append("not borrowed")
+        self.assertEqual(self.lib_db.retrieve_patron("P001").get_borrowed_books(), [])
+        self.assertEqual([p.get_memberID() for p in self.lib_db.iter_patrons()], ["P001", "P002", "P003"])
+        self.assertEqual([len(chunk) for chunk in self.lib_db.iter_patrons(chunk_size=2)], [2, 1])
+
+    def test_open_library_db(self):
+        lib_db = library_db_interface.open_library_db('log', os.path.join(self.tmp_dir, 'other.log'), sync=True)
+        self.assertIsInstance(lib_db, Log_Library_DB)
+        self.assertIsInstance(lib_db, library_db_interface.Base_Library_DB)
+        self.assertNotIsInstance(lib_db, library_db_interface.Library_DB)
+        self.assertEqual(lib_db.insert_patron(self.patron), 1)
+        lib_db.close_db()
+
+    def tearDown(self):
+        self.lib_db.close_db()
+        shutil.rmtree(self.tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+from library import metrics
+from library.cache import ResponseCache
+from library.ext_api_interface import Books_API
+from library.library import Library
+from library.library_db_interface import Library_DB
+from library.patron import Patron
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.original_borrow = Library.borrow_book
+
+    def test_disabled_by_default(self):
+        self.assertFalse(metrics.is_enabled())
+        self.assertIs(Library.__dict__['borrow_book'], self.original_borrow)
+        #counting while disabled is a no-op
+        metrics.count(metrics.DOCS_SCANNED, 5)
+
+    def test_enable_and_disable(self):
+        sink = metrics.enable()
+        self.assertIsInstance(sink, metrics.InMemorySink)
+        self.assertIsNot(Library.__dict__['borrow_book'], self.original_borrow)
+        metrics.disable()
+        self.assertFalse(metrics.is_enabled())
+        self.assertIs(Library.__dict__['borrow_book'], self.original_borrow)
+
+    def test_library_and_db_calls(self):
+        sink = metrics.enable()
+        lib_db = Library_DB(os.path.join(self.tmp_dir, 'db.json'))
+        library = Library(db=lib_db, api=MagicMock())
+        library.register_patron("John", "Doe", 25, "P001")
+        patron = lib_db.retrieve_patron("P001")
+        library.borrow_book("Dune", patron)
+        list(lib_db.iter_patrons())
+        lib_db.close_db()
+
+        self.assertEqual(sink.calls["Library.register_patron"], 1)
+        self.assertEqual(sink.calls["Library.borrow_book"], 1)
+        self.assertEqual(sink.calls["Library_DB.insert_patron"], 1)
+        self.assertEqual(sink.calls["Library_DB.add_borrowed_book"], 1)
+        self.assertEqual(sink.calls["Library_DB.iter_patrons"], 1)
+        self.assertEqual(sum(sink.histograms["Library.borrow_book"]), 1)
+        #retrieve_patron, add_borrowed_book and iter_patrons each load the one patron
+        self.assertEqual(sink.counters[metrics.DOCS_SCANNED], 3)
+
+    def test_docs_scanned_by_lookups(self):
+        lib_db = Library_DB(os.path.join(self.tmp_dir, 'db.json'))
+        lib_db.insert_patrons([Patron("John", "Doe", 25, "P%03d" % i) for i in range(10)])
+        sink = metrics.enable()
+        lib_db.retrieve_patron("P001")
+        lib_db.add_borrowed_book("P001", "dune")
+        lib_db.close_db()
+        #TinyDB rebuilds the whole table even for lookups by document ID
+        self.assertEqual(sink.counters[metrics.DOCS_SCANNED], 20)
+
+    @patch.object(requests.Session, "get")
+    def test_books_api_bytes_and_cache(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.content = b'{"docs": [{"title": "Dune"}]}'
+        mock_response.json.return_value = {"docs": [{"title": "Dune"}]}
+        mock_get.return_value = mock_response
+        sink = metrics.enable()
+        api = Books_API(cache=ResponseCache())
+        api.is_book_available("Dune")
+        api.is_book_available("Dune")
+        api.close()
+
+        self.assertEqual(sink.calls["Books_API.is_book_available"], 2)
+        self.assertEqual(sink.calls["Books_API.make_request"], 2)
+        self.assertEqual(sink.counters[metrics.BYTES_FETCHED], len(mock_response.content))
+        self.assertEqual(sink.cache_hit_rate(), 0.5)
+
+    def test_prometheus_text(self):
+        sink = metrics.InMemorySink()
+        sink.observe("Library.borrow_book", 0.002)
+        sink.observe("Library.borrow_book", 2.0)
+        sink.count(metrics.CACHE_HITS, 3)
+        sink.count(metrics.CACHE_MISSES, 1)
+        text = sink.prometheus_text()
+        self.assertIn('library_calls_total{method="Library.borrow_book"} 2', text)
+        self.assertIn('library_call_seconds_bucket{method="Library.borrow_book",le="0.005"} 1', text)
+        self.assertIn('library_call_seconds_bucket{method="Library.borrow_book",le="+Inf"} 2', text)
+        self.assertIn('library_call_seconds_count{method="Library.borrow_book"} 2', text)
+        self.assertIn('library_events_total{name="books_api.cache_hits"} 3', text)
+        self.assertIn('library_cache_hit_ratio 0.750000', text)
+
+    def test_logging_sink(self):
+        with self.assertLogs('library.metrics', level=logging.DEBUG) as logs:
+            metrics.enable(metrics.LoggingSink())
+            metrics.count(metrics.DOCS_SCANNED, 4)
+            Library.is_book_borrowed(MagicMock(), "Dune", Patron("John", "Doe", 25, "P001"))
+        self.assertIn("library_db.docs_scanned += 4", logs.output[0])
+        self.assertIn("Library.is_book_borrowed took", logs.output[1])
+
+    def tearDown(self):
+        metrics.disable()
+        shutil.rmtree(self.tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -34,6 +34,33 @@ class TestPatron(unittest.TestCase):
         with self.assertRaises(InvalidNameException):
             binstance = Patron(badfname,badlname,age,id)
 
+    def test_bad_constructor_unicode_digit(self):
+        with self.assertRaises(InvalidNameException):
+            Patron("mari\u0663gold", "p", 22, 0)
+
+    def test_from_record(self):
+        record = {'fname': 'marigold', 'lname': 'p', 'age': 22, 'memberID': 0}
+        patron = Patron.from_record(record)
+        self.assertEqual(patron, self.instance)
+        self.assertEqual(patron.get_borrowed_books(), [])
+
+    def test_from_record_borrowed_books(self):
+        record = {'fname': 'marigold', 'lname': 'p', 'age': 22, 'memberID': 0,
+                  'borrowed_books': ['testing and you!', 'testing and me!']}
+        patron = Patron.from_record(record)
+        self.assertEqual(patron.get_borrowed_books(), ['testing and you!', 'testing and me!'])
+        self.assertTrue(patron.has_borrowed_book('testing and me!'))
+
+    def test_from_record_legacy_titles(self):
+        record = {'fname': 'marigold', 'lname': 'p', 'age': 22, 'memberID': 0,
+                  'borrowed_books': ['die straße', 'the  hobbit', 'die strasse']}
+        patron = Patron.from_record(record)
+        self.assertEqual(patron.get_borrowed_books(), ['die strasse', 'the hobbit'])
+
+    def test_from_record_skips_validation(self):
+        patron = Patron.from_record({'fname': 'r2d2', 'lname': 'p', 'age': 22, 'memberID': 0})
+        self.assertEqual(patron.get_fname(), 'r2d2')
+
     def test_add_borrowed_book(self):
         book = "Testing and YOU!"
         self.instance.add_borrowed_book(book)
@@ -52,6 +79,34 @@ class TestPatron(unittest.TestCase):
         self.instance.return_borrowed_book(book)
         self.assertEqual(self.instance.get_borrowed_books(),[])
         
+    def test_borrowed_books_keep_order(self):
+        for book in ["C", "A", "B", "A"]:
+            self.instance.add_borrowed_book(book)
+        self.instance.return_borrowed_book("a")
+        self.instance.add_borrowed_book("A")
+        self.assertEqual(self.instance.get_borrowed_books(), ["c", "b", "a"])
+        self.assertEqual(self.instance.borrowed_books, ["c", "b", "a"])
+
+    def test_borrowed_book_titles_normalized(self):
+        self.instance.add_borrowed_book("  Die   Straße ")
+        self.assertEqual(self.instance.get_borrowed_books(), ["die strasse"])
+        self.instance.return_borrowed_book("DIE STRASSE")
+        self.assertEqual(self.instance.get_borrowed_books(), [])
+
+    def test_has_borrowed_book(self):
+        self.instance.add_borrowed_book("Testing and YOU!")
+        self.assertTrue(self.instance.has_borrowed_book("testing and you!"))
+        self.assertFalse(self.instance.has_borrowed_book("testing and me!"))
+
+    def test_slots(self):
+        self.assertFalse(hasattr(self.instance, '__dict__'))
+        with self.assertRaises(AttributeError):
+            self.instance.nickname = "goldie"
+
+    def test_get_borrowed_books_is_a_copy(self):
+        self.instance.get_borrowed_books().append("not borrowed")
+        self.assertEqual(self.instance.get_borrowed_books(), [])
+
     def test_equal_patrons(self):
         fname = 'marigold'
         lname ='p'
@@ -70,6 +125,12 @@ class TestPatron(unittest.TestCase):
         #should be unequal
         self.assertTrue(self.instance.__ne__(second))
 
+    def test_unequal_borrowed_books(self):
+        second = Patron('marigold', 'p', 22, 0)
+        second.add_borrowed_book("Testing and YOU!")
+        self.assertNotEqual(self.instance, second)
+        self.assertNotEqual(self.instance, "marigold")
+
     def test_getters(self):
         self.assertEqual(self.instance.get_fname(),"marigold")
         self.assertEqual(self.instance.get_lname(),"p")
@@ -0,0 +1,181 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+from library.ext_api_interface import Books_API
+from library.resilience import CircuitBreaker, SingleFlight
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10,
+                                      clock=lambda: self.now)
+
+    def test_opens_after_threshold(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_success_resets_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_probe_closes(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.now = 10
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+        #only one probe at a time
+        self.assertFalse(self.breaker.allow_request())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_half_open_probe_reopens(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.now = 10
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.now = 15
+        self.assertFalse(self.breaker.allow_request())
+        self.now = 20
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_lost_probe_is_replaced(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.now = 10
+        self.assertTrue(self.breaker.allow_request())
+        self.now = 20
+        self.assertTrue(self.breaker.allow_request())
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_calls_share_one(self):
+        flights = SingleFlight()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return "result"
+
+        def caller():
+            results.append(flights.do("key", fetch))
+        threads = [threading.Thread(target=caller) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while not calls:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [("result", False)] + [("result", True)] * 4)
+        self.assertEqual(len(flights), 0)
+
+    def test_exception_is_raised(self):
+        flights = SingleFlight()
+        with self.assertRaises(ValueError):
+            flights.do("key", MagicMock(side_effect=ValueError("bad")))
+        self.assertEqual(flights.do("key", lambda: 1), (1, False))
+
+
+class TestBooks_API_Resilience(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30,
+                                      clock=lambda: self.now)
+        self.api = Books_API(breaker=self.breaker)
+        self.url = "http://openlibrary.org/search.json?q=test"
+
+    @patch.object(requests.Session, "get")
+    def test_breaker_fails_fast(self, mock_get):
+        mock_get.side_effect = requests.exceptions.ReadTimeout("Mocked Timeout")
+        self.assertIsNone(self.api.make_request(self.url))
+        self.assertIsNone(self.api.make_request(self.url))
+        self.assertIsNone(self.api.make_request(self.url))
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch.object(requests.Session, "get")
+    def test_server_errors_open_breaker(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.status_code = 503
+        mock_get.return_value = mock_response
+        self.api.make_request(self.url)
+        self.api.make_request(self.url)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    @patch.object(requests.Session, "get")
+    def test_not_found_is_not_a_failure(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.status_code = 404
+        mock_get.return_value = mock_response
+        self.api.make_request(self.url)
+        self.api.make_request(self.url)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    @patch.object(requests.Session, "get")
+    def test_half_open_probe_recovers(self, mock_get):
+        mock_get.side_effect = requests.exceptions.ConnectionError("Mocked Connection Error")
+        self.api.make_request(self.url)
+        self.api.make_request(self.url)
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"docs": [{"title": "Test Book"}]}
+        mock_get.side_effect = None
+        mock_get.return_value = mock_response
+        self.now = 30
+        self.assertEqual(self.api.make_request(self.url), {"docs": [{"title": "Test Book"}]})
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    @patch.object(requests.Session, "get")
+    def test_identical_requests_coalesce(self, mock_get):
+        release = threading.Event()
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"docs": [{"title": "Test Book"}]}
+
+        def slow_get(*args, **kwargs):
+            release.wait(5)
+            return mock_response
+        mock_get.side_effect = slow_get
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.api.make_request(self.url)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while not mock_get.called:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(results, [{"docs": [{"title": "Test Book"}]}] * 5)
+
+    def tearDown(self):
+        self.api.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
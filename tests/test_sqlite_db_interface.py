@@ -0,0 +1,186 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from library import library_db_interface
+from library.patron import Patron
+from library.sqlite_db_interface import SQLite_Library_DB, migrate_json_to_sqlite
+
+
+class TestSQLiteLibraryDB(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'db.sqlite3')
+        self.lib_db = SQLite_Library_DB(self.path)
+        self.patron = Patron("John", "Doe", 25, "P001")
+
+    def test_legacy_titles_normalized_on_open(self):
+        with self.lib_db.conn:
+            self.lib_db.conn.execute(SQLite_Library_DB.INSERT_PATRON,
+                ("P001", "John", "Doe", 25, '["die stra\\u00dfe", "the  hobbit"]'))
+            self.lib_db.conn.execute(SQLite_Library_DB.INSERT_LOAN, ("die straße", "P001"))
+            self.lib_db.conn.execute("PRAGMA user_version = 0")
+        self.lib_db.close_db()
+        self.lib_db = SQLite_Library_DB(self.path)
+        self.assertEqual(self.lib_db.get_holders("die strasse"), {"P001"})
+        self.assertEqual(self.lib_db.count_holders("die straße"), 0)
+        self.assertTrue(self.lib_db.remove_borrowed_book("P001", "die strasse"))
+        self.assertEqual(self.lib_db.retrieve_patron("P001").get_borrowed_books(), ["the hobbit"])
+
+    def test_wal_mode(self):
+        mode = self.lib_db.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, 'wal')
+
+    def test_insert_and_retrieve_patron(self):
+        self.patron.add_borrowed_book("dune")
+        self.assertIsNotNone(self.lib_db.insert_patron(self.patron))
+        result = self.lib_db.retrieve_patron("P001")
+        self.assertEqual(result, self.patron)
+        self.assertIsNone(self.lib_db.retrieve_patron("NOPE"))
+
+    def test_insert_duplicate_and_invalid(self):
+        self.assertIsNotNone(self.lib_db.insert_patron(self.patron))
+        self.assertIsNone(self.lib_db.insert_patron(Patron("Jane", "Doe", 23, "P001")))
+        self.assertIsNone(self.lib_db.insert_patron(None))
+        self.assertEqual(self.lib_db.get_patron_count(), 1)
+
+    def test_memberID_types_kept(self):
+        self.lib_db.insert_patron(Patron("John", "Doe", 25, 0))
+        self.lib_db.insert_patron(Patron("Jane", "Doe", 23, "0"))
+        self.assertEqual(self.lib_db.get_patron_count(), 2)
+        self.assertEqual(self.lib_db.retrieve_patron(0).get_fname(), "John")
+
+    def test_insert_patrons(self):
+        self.lib_db.insert_patron(self.patron)
+        result = self.lib_db.insert_patrons([self.patron, Patron("Jane", "Doe", 23, "P002"),
+            None, Patron("Jane", "Smith", 30, "P002")])
+        self.assertIsNone(result[0])
+        self.assertIsNotNone(result[1])
+        self.assertEqual(result[2:], [None, None])
+        self.assertEqual(self.lib_db.get_patron_count(), 2)
+
+    def test_update_patron(self):
+        self.lib_db.insert_patron(self.patron)
+        updated = Patron("Johnny", "Doe", 26, "P001")
+        updated.add_borrowed_book("emma")
+        self.lib_db.update_patron(updated)
+        self.assertEqual(self.lib_db.retrieve_patron("P001"), updated)
+        self.assertEqual(self.lib_db.get_holders("emma"), {"P001"})
+        self.assertIsNone(self.lib_db.update_patron(None))
+
+    def test_update_patrons(self):
+        self.lib_db.insert_patron(self.patron)
+        self.patron.add_borrowed_book("dune")
+        result = self.lib_db.update_patrons([self.patron, Patron("Jane", "Doe", 23, "P002")])
+        self.assertEqual(result, ["P001"])
+        self.assertEqual(self.lib_db.retrieve_patron("P001").get_borrowed_books(), ["dune"])
+
+    def test_borrowed_books_and_holders(self):
+        self.lib_db.insert_patrons([self.patron, Patron("Jane", "Doe", 23, "P002")])
+        self.assertTrue(self.lib_db.add_borrowed_book("P001", "dune"))
+        self.assertTrue(self.lib_db.add_borrowed_book("P001", "dune"))
+        self.assertTrue(self.lib_db.add_borrowed_book("P002", "dune"))
+        self.assertEqual(self.lib_db.get_holders("dune"), {"P001", "P002"})
+        self.assertEqual(self.lib_db.count_holders("dune"), 2)
+        self.assertTrue(self.lib_db.remove_borrowed_book("P001", "dune"))
+        self.assertEqual(self.lib_db.retrieve_patron("P001").get_borrowed_books(), [])
+        self.assertEqual(self.lib_db.get_holders("dune"), {"P002"})
+        self.assertFalse(self.lib_db.add_borrowed_book("NOPE", "dune"))
+        self.assertFalse(self.lib_db.remove_borrowed_book("NOPE", "dune"))
+
+    def test_retrieve_patrons(self):
+        self.lib_db.insert_patrons([self.patron, Patron("Jane", "Doe", 23, "P002")])
+        with patch.object(SQLite_Library_DB, 'LOOKUP_BATCH', 1):
+            result = self.lib_db.retrieve_patrons(["P002", "NOPE", "P001"])
+        self.assertEqual([patron.get_fname() if patron else None for patron in result], ["Jane", None, "John"])
+
+    def test_all_and_iter_patrons(self):
+        self.lib_db.insert_patrons([self.patron, Patron("Jane", "Doe", 23, "P002"), Patron("Jim", "Doe", 40, "P003")])
+        self.assertEqual(self.lib_db.get_all_patrons()[0],
+            {'fname': 'John', 'lname': 'Doe', 'age': 25, 'memberID': 'P001', 'borrowed_books': []})
+        self.assertEqual([p.get_memberID() for p in self.lib_db.iter_patrons()], ["P001", "P002", "P003"])
+        self.assertEqual([len(chunk) for chunk in self.lib_db.iter_patrons(chunk_size=2)], [2, 1])
+
+    def test_persists_after_close(self):
+        with SQLite_Library_DB(self.path) as lib_db:
+            lib_db.insert_patron(self.patron)
+        reopened = SQLite_Library_DB(self.path)
+        self.assertEqual(reopened.retrieve_patron("P001"), self.patron)
+        reopened.close_db()
+
+    def tearDown(self):
+        self.lib_db.close_db()
+        shutil.rmtree(self.tmp_dir)
+
+
+class TestOpenLibraryDB(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def test_engine_argument(self):
+        lib_db = library_db_interface.open_library_db('sqlite', os.path.join(self.tmp_dir, 'db.sqlite3'))
+        self.assertIsInstance(lib_db, SQLite_Library_DB)
+        self.assertIsInstance(lib_db, library_db_interface.Base_Library_DB)
+        self.assertNotIsInstance(lib_db, library_db_interface.Library_DB)
+        lib_db.close_db()
+
+    @patch.dict(os.environ, {'LIBRARY_DB_ENGINE': 'tinydb'})
+    def test_engine_from_environment(self):
+        with patch.dict(os.environ, {'LIBRARY_DB_PATH': os.path.join(self.tmp_dir, 'db.json')}):
+            lib_db = library_db_interface.open_library_db()
+        self.assertIs(type(lib_db), library_db_interface.Library_DB)
+        lib_db.close_db()
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, 'db.json')))
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            library_db_interface.open_library_db('postgres')
+
+    def test_migrate_json_to_sqlite(self):
+        json_path = os.path.join(self.tmp_dir, 'db.json')
+        sqlite_path = os.path.join(self.tmp_dir, 'db.sqlite3')
+        with library_db_interface.Library_DB(json_path) as lib_db:
+            patron = Patron("John", "Doe", 25, "P001")
+            patron.add_borrowed_book("dune")
+            lib_db.insert_patrons([patron, Patron("Jane", "Doe", 23, "P002")])
+
+        self.assertEqual(migrate_json_to_sqlite(json_path, sqlite_path), 2)
+        #running it again copies nothing new
+        self.assertEqual(migrate_json_to_sqlite(json_path, sqlite_path), 0)
+
+        with SQLite_Library_DB(sqlite_path) as lib_db:
+            self.assertEqual(lib_db.get_patron_count(), 2)
+            self.assertEqual(lib_db.retrieve_patron("P001"), patron)
+            self.assertEqual(lib_db.get_holders("dune"), {"P001"})
+
+    def test_migrate_missing_json_file(self):
+        json_path = os.path.join(self.tmp_dir, 'missing.json')
+        with self.assertRaises(FileNotFoundError):
+            migrate_json_to_sqlite(json_path, os.path.join(self.tmp_dir, 'new.sqlite3'))
+        self.assertFalse(os.path.exists(json_path))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'new.sqlite3')))
+
+    def test_migrate_leaves_json_file_alone(self):
+        json_path = os.path.join(self.tmp_dir, 'db.json')
+        with open(json_path, 'w') as json_file:
+            json.dump({'_default': {'1': {'fname': 'John', 'lname': 'Doe', 'age': 25,
+                'memberID': 'P001', 'borrowed_books': ['Dune']}}}, json_file)
+        with open(json_path, 'rb') as json_file:
+            original = json_file.read()
+        self.assertEqual(migrate_json_to_sqlite(json_path, os.path.join(self.tmp_dir, 'new.sqlite3')), 1)
+        with open(json_path, 'rb') as json_file:
+            self.assertEqual(json_file.read(), original)
+        with SQLite_Library_DB(os.path.join(self.tmp_dir, 'new.sqlite3')) as lib_db:
+            self.assertEqual(lib_db.get_holders("dune"), {"P001"})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
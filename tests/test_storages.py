@@ -0,0 +1,137 @@
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from tinydb import TinyDB
+from tinydb.storages import MemoryStorage
+from library import storages
+from library.storages import BufferedMiddleware, FastJSONStorage
+
+
+class CountingStorage(MemoryStorage):
+    """MemoryStorage that remembers how many times it was written."""
+
+    def __init__(self):
+        super(CountingStorage, self).__init__()
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        super(CountingStorage, self).write(data)
+
+
+class TestBufferedMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        self.middleware = BufferedMiddleware(CountingStorage, flush_every=3)()
+
+    def test_reads_see_buffered_writes(self):
+        self.middleware.write({'_default': {'1': {'memberID': 'P001'}}})
+        self.assertEqual(self.middleware.read(), {'_default': {'1': {'memberID': 'P001'}}})
+        self.assertEqual(self.middleware.storage.writes, 0)
+
+    def test_flush_every(self):
+        for i in range(2):
+            self.middleware.write({'n': i})
+        self.assertEqual(self.middleware.storage.writes, 0)
+        self.middleware.write({'n': 2})
+        self.assertEqual(self.middleware.storage.writes, 1)
+        self.assertEqual(self.middleware.storage.memory, {'n': 2})
+
+    @patch('library.storages.time.monotonic')
+    def test_flush_interval(self, mock_monotonic):
+        mock_monotonic.return_value = 100.0
+        middleware = BufferedMiddleware(CountingStorage, flush_every=1000, flush_interval=5)()
+        middleware.write({'n': 0})
+        self.assertEqual(middleware.storage.writes, 0)
+        mock_monotonic.return_value = 106.0
+        middleware.write({'n': 1})
+        self.assertEqual(middleware.storage.writes, 1)
+
+    def test_close_flushes(self):
+        self.middleware.write({'n': 0})
+        self.middleware.close()
+        self.assertEqual(self.middleware.storage.writes, 1)
+        self.assertEqual(self.middleware.storage.memory, {'n': 0})
+
+    def test_flush_without_writes(self):
+        self.middleware.flush()
+        self.assertEqual(self.middleware.storage.writes, 0)
+
+
+class TestFastJSONStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'db.json')
+
+    def test_empty_file(self):
+        storage = FastJSONStorage(self.path)
+        self.assertTrue(os.path.exists(self.path))
+        self.assertIsNone(storage.read())
+
+    def test_round_trip_compact(self):
+        storage = FastJSONStorage(self.path)
+        storage.write({'_default': {1: {'fname': 'Zoë', 'borrowed_books': ['dune']}}})
+        self.assertEqual(storage.read(), {'_default': {'1': {'fname': 'Zoë', 'borrowed_books': ['dune']}}})
+        with open(self.path, 'rb') as db_file:
+            contents = db_file.read()
+        self.assertNotIn(b' ', contents)
+        self.assertEqual(os.listdir(self.tmp_dir), ['db.json'])
+
+    def test_reads_tinydb_json_files(self):
+        with TinyDB(self.path) as db:
+            db.insert({'memberID': 'P001'})
+        with TinyDB(self.path, storage=FastJSONStorage) as db:
+            self.assertEqual(db.all(), [{'memberID': 'P001'}])
+            db.insert({'memberID': 'P002'})
+        with TinyDB(self.path) as db:
+            self.assertEqual(len(db), 2)
+
+    def test_failed_write_keeps_old_file(self):
+        storage = FastJSONStorage(self.path)
+        storage.write({'_default': {}})
+        with patch('library.storages.os.fsync', side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                storage.write({'_default': {'1': {'memberID': 'P001'}}})
+        self.assertEqual(storage.read(), {'_default': {}})
+        self.assertEqual(os.listdir(self.tmp_dir), ['db.json'])
+
+    def test_failed_write_closes_temp_file(self):
+        storage = FastJSONStorage(self.path)
+        os.remove(self.path)
+        fds = []
+        original_mkstemp = tempfile.mkstemp
+        def mkstemp(*args, **kwargs):
+            fd, path = original_mkstemp(*args, **kwargs)
+            fds.append(fd)
+            return fd, path
+        with patch('library.storages.tempfile.mkstemp', side_effect=mkstemp):
+            with self.assertRaises(FileNotFoundError):
+                storage.write({'_default': {}})
+        with self.assertRaises(OSError):
+            os.fstat(fds[0])
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_stdlib_fallback(self):
+        #pretend neither fast library is installed
+        try:
+            with patch.dict(sys.modules, {'orjson': None, 'ujson': None}):
+                fallback = importlib.reload(storages)
+            self.assertEqual(fallback.JSON_LIBRARY, 'json')
+            storage = fallback.FastJSONStorage(self.path)
+            storage.write({'_default': {1: {'memberID': 'P001'}}})
+            self.assertEqual(storage.read(), {'_default': {'1': {'memberID': 'P001'}}})
+        finally:
+            importlib.reload(storages)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+import unittest
+
+from library.titles import normalize_title
+
+
+class TestNormalizeTitle(unittest.TestCase):
+
+    def test_case_folded(self):
+        self.assertEqual(normalize_title("Testing and YOU!"), "testing and you!")
+        self.assertEqual(normalize_title("Die Straße"), "die strasse")
+
+    def test_whitespace_collapsed(self):
+        self.assertEqual(normalize_title("  Dune \t Messiah\n"), "dune messiah")
+
+    def test_unicode_normalized(self):
+        #composed and decomposed forms, and compatibility characters
+        self.assertEqual(normalize_title("Café"), normalize_title("Café"))
+        self.assertEqual(normalize_title("Ｄune"), "dune")
+
+    def test_cached_and_interned(self):
+        first = normalize_title("Some " + "Long Title")
+        second = normalize_title("Some Long " + "Title")
+        self.assertIs(first, second)
+        self.assertGreater(normalize_title.cache_info().hits, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()